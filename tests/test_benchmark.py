@@ -0,0 +1,72 @@
+import time
+import unittest
+from thread_order.scheduler import Scheduler, register_functions
+
+class TestDispatchLatency(unittest.TestCase):
+
+    def test_chain_dispatch_delay_per_edge(self):
+        # a chain of no-op tasks; every edge waits for the scheduler to react to a 'done'
+        # event before the next task can be dispatched, so the gap between a task ending
+        # and its dependent starting is the per-edge dispatch delay
+        size = 200
+        started = {}
+        finished = {}
+
+        def make_task(name):
+            def task():
+                started[name] = time.perf_counter()
+                finished[name] = time.perf_counter()
+            return task
+
+        s = Scheduler(workers=4, store_results=False)
+        previous = None
+        for index in range(size):
+            name = f'task{index:04d}'
+            s.register(make_task(name), name, after=[previous] if previous else None)
+            previous = name
+        summary = s.start()
+
+        self.assertEqual(len(summary['passed']), size)
+        names = sorted(started)
+        delays = [started[child] - finished[parent] for parent, child in zip(names, names[1:])]
+        mean_us = sum(delays) / len(delays) * 1e6
+        # the previous poll-based loop averaged tens of milliseconds per edge
+        self.assertLess(mean_us, 5000, f'mean dispatch delay {mean_us:.0f}us per edge')
+
+class TestRegistrationScaling(unittest.TestCase):
+
+    def _register(self, size, bulk=True):
+        # a long chain with a side branch on every node; deep enough to overflow a
+        # recursive cycle check and large enough to expose quadratic registration
+        functions = []
+        for index in range(size):
+            name = f'task{index:06d}'
+            after = [f'task{index - 1:06d}'] if index else []
+            if index > 1:
+                after.append(f'task{index - 2:06d}')
+            functions.append((name, lambda: None, {'after': after, 'with_state': False}))
+        s = Scheduler(workers=1)
+        started = time.perf_counter()
+        if bulk:
+            register_functions(s, functions, None, False)
+        else:
+            # one at a time, so every node goes through DAGraph.add and its cycle check
+            for name, function, meta in functions:
+                s.register(function, name, after=meta['after'])
+        duration = time.perf_counter() - started
+        self.assertEqual(len(s.graph.nodes()), size)
+        return duration
+
+    def assertScalesLinearly(self, bulk):
+        # best of three to keep a stray GC pause from skewing the ratio
+        small = min(self._register(5000, bulk) for _ in range(3))
+        large = min(self._register(20000, bulk) for _ in range(3))
+        # 4x the tasks: linear registration takes ~4x as long, quadratic ~16x
+        self.assertLess(large, max(small, 0.01) * 10,
+                        f'5k tasks in {small:.3f}s, 20k tasks in {large:.3f}s')
+
+    def test_register_functions_scales_linearly(self):
+        self.assertScalesLinearly(bulk=True)
+
+    def test_register_scales_linearly(self):
+        self.assertScalesLinearly(bulk=False)
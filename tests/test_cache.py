@@ -0,0 +1,143 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from thread_order.cache import (
+    DiscoveryCache, ResultCache, file_digest, function_digest, value_digest, result_key)
+
+class TestDiscoveryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.module_path = os.path.join(self.tmpdir.name, 'module1.py')
+        with open(self.module_path, 'w', encoding='utf-8') as f:
+            f.write('x = 1\n')
+        self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+        self.entries = [{'name': 'fn_a', 'after': [], 'with_state': True, 'tags': [], 'is_async': False}]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_file_digest(self):
+        self.assertEqual(
+            file_digest(self.module_path), hashlib.sha256(b'x = 1\n').hexdigest())
+
+    def test_load_When_Missing(self):
+        self.assertIsNone(DiscoveryCache(self.cache_dir).load(self.module_path))
+
+    def test_save_and_load(self):
+        DiscoveryCache(self.cache_dir).save(self.module_path, self.entries)
+        self.assertEqual(DiscoveryCache(self.cache_dir).load(self.module_path), self.entries)
+
+    def test_load_When_ModuleChanged(self):
+        DiscoveryCache(self.cache_dir).save(self.module_path, self.entries)
+        with open(self.module_path, 'a', encoding='utf-8') as f:
+            f.write('y = 2\n')
+        self.assertIsNone(DiscoveryCache(self.cache_dir).load(self.module_path))
+
+    @patch('thread_order.__version__', '0.0.1')
+    def test_load_When_VersionChanged(self):
+        DiscoveryCache(self.cache_dir).save(self.module_path, self.entries)
+        with patch('thread_order.__version__', '0.0.2'):
+            self.assertIsNone(DiscoveryCache(self.cache_dir).load(self.module_path))
+
+    def test_save_When_NotSerializable(self):
+        cache = DiscoveryCache(self.cache_dir)
+        cache.save(self.module_path, [{'name': object()}])
+        self.assertIsNone(DiscoveryCache(self.cache_dir).load(self.module_path))
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_load_When_Missing(self):
+        with self.assertRaises(KeyError):
+            ResultCache(self.tmpdir.name).load('ab' * 32)
+
+    def test_save_and_load(self):
+        self.assertTrue(ResultCache(self.tmpdir.name).save('ab' * 32, {'rows': [1, 2]}))
+        self.assertEqual(ResultCache(self.tmpdir.name).load('ab' * 32), {'rows': [1, 2]})
+
+    def test_save_When_NotPicklable(self):
+        cache = ResultCache(self.tmpdir.name)
+        self.assertFalse(cache.save('ab' * 32, threading.Lock()))
+        with self.assertRaises(KeyError):
+            cache.load('ab' * 32)
+
+    def test_save_When_LargerThanMaxSize(self):
+        cache = ResultCache(self.tmpdir.name, max_size=10)
+        self.assertFalse(cache.save('ab' * 32, 'x' * 100))
+
+    def test_save_When_Full(self):
+        cache = ResultCache(self.tmpdir.name, max_size=250)
+        for i, key in enumerate(['aa', 'bb']):
+            cache.save(key * 32, 'x' * 100)
+            past = time.time() - 100 + i
+            os.utime(cache._entry_path(key * 32), (past, past))
+        # loading a result makes it the most recently used
+        cache.load('aa' * 32)
+        cache.save('cc' * 32, 'x' * 100)
+        with self.assertRaises(KeyError):
+            cache.load('bb' * 32)
+        self.assertEqual(cache.load('aa' * 32), 'x' * 100)
+        self.assertEqual(cache.load('cc' * 32), 'x' * 100)
+
+    def test_save_When_Concurrent(self):
+        cache = ResultCache(self.tmpdir.name, max_size=2000)
+        keys = [f'{i % 8:02}' * 32 for i in range(64)]
+        barrier = threading.Barrier(16)
+
+        def save(chunk):
+            barrier.wait()
+            for key in chunk:
+                self.assertTrue(cache.save(key, key * 4))
+
+        threads = [threading.Thread(target=save, args=(keys[i::16],)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stored = list(cache._entries())
+        # the size kept in memory matches what is on disk, and no temporary file is left
+        self.assertEqual(cache._size, sum(size for _, size, _ in stored))
+        self.assertLessEqual(cache._size, 2000)
+        self.assertEqual(list(cache._directory.glob('*/*.tmp')), [])
+        for _, _, path in stored:
+            self.assertEqual(cache.load(path.stem), path.stem * 4)
+
+    def test_function_digest(self):
+        def task():
+            return 1
+        self.assertEqual(len(function_digest(task)), 64)
+        self.assertIsNone(function_digest(len))
+
+    def test_function_digest_When_Closure(self):
+        def make(value, scale=1):
+            def task():
+                return value * scale
+            return task
+        self.assertEqual(function_digest(make(1)), function_digest(make(1)))
+        self.assertNotEqual(function_digest(make(1)), function_digest(make(2)))
+        self.assertIsNone(function_digest(make(threading.Lock())))
+
+        def defaults(value=1):
+            return value
+        digest = function_digest(defaults)
+        defaults.__defaults__ = (2,)
+        self.assertNotEqual(function_digest(defaults), digest)
+
+    def test_value_digest(self):
+        self.assertEqual(value_digest([1, 2]), value_digest([1, 2]))
+        self.assertNotEqual(value_digest([1, 2]), value_digest([2, 1]))
+        self.assertIsNone(value_digest(threading.Lock()))
+
+    def test_result_key(self):
+        self.assertEqual(result_key({'a': 1, 'b': 2}), result_key({'b': 2, 'a': 1}))
+        self.assertNotEqual(result_key({'a': 1}), result_key({'a': 2}))
@@ -0,0 +1,20 @@
+import unittest
+from thread_order.capacity import Capacity
+
+class TestCapacity(unittest.TestCase):
+
+    def test_claim_and_release(self):
+        capacity = Capacity({'thread': 2, 'process': 1})
+        self.assertIsNone(capacity.claim({'thread': 1, 'process': 1}))
+        # all or nothing: thread has room but process does not
+        self.assertEqual(capacity.claim({'thread': 1, 'process': 1}), 'process')
+        self.assertEqual(capacity.used('thread'), 1)
+        self.assertIsNone(capacity.claim({'thread': 1}))
+        self.assertEqual(capacity.blocker({'thread': 1}), 'thread')
+        capacity.release({'thread': 1, 'process': 1})
+        self.assertEqual(capacity.used('thread'), 1)
+        self.assertEqual(capacity.used('process'), 0)
+        self.assertEqual(capacity.limit('thread'), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import asyncio
+import threading
+import unittest
+from thread_order.executors import AsyncLoopExecutor
+
+class TestAsyncLoopExecutor(unittest.TestCase):
+
+    def test_submit(self):
+        async def task(value):
+            await asyncio.sleep(0)
+            return value, threading.current_thread().name
+
+        with AsyncLoopExecutor(thread_name='loop_0') as executor:
+            future = executor.submit(task, 1)
+            self.assertEqual(future.result(timeout=5), (1, 'loop_0'))
+
+    def test_shutdown_When_CancelFutures(self):
+        async def task():
+            await asyncio.sleep(60)
+
+        executor = AsyncLoopExecutor()
+        future = executor.submit(task)
+        executor.shutdown(cancel_futures=True)
+        self.assertTrue(future.cancelled())
+        with self.assertRaises(RuntimeError):
+            executor.submit(task)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -68,6 +68,32 @@ class TestDAGraph(unittest.TestCase):
         candidates = self.graph.get_candidates(['a', 'b'], 4, sort=True)
         self.assertEqual(candidates, [])
 
+    def test_get_candidates_When_ParentsRemoved(self, *patches):
+        self.assertEqual(self.graph.get_candidates([], 1), ['a'])
+        self.assertEqual(self.graph.get_candidates(['a'], 4), ['b'])
+        self.graph.remove('a')
+        self.assertEqual(self.graph.get_candidates(['b'], 4), ['c', 'd'])
+        self.graph.remove('d')
+        self.assertEqual(self.graph.get_candidates(['b', 'c'], 4), [])
+        self.graph.remove('b')
+        self.graph.remove('e')
+        self.assertEqual(self.graph.get_candidates(['c'], 4), ['f'])
+
+    def test_remove_Should_DecrementDependencyCounts(self, *patches):
+        self.graph.remove('d')
+        self.assertEqual(dict(self.graph.dependency_counts)['f'], 1)
+        self.assertEqual(self.graph.parents_of('f'), ['e'])
+        self.assertEqual(self.graph.original_parents_of('f'), ['d', 'e'])
+
+    def test_add_When_DuplicateDependency(self, *patches):
+        g = DAGraph()
+        g.add('a')
+        g.add('b', after=['a', 'a'])
+        self.assertEqual(g.parents_of('b'), ['a'])
+        g.get_candidates([], 1)
+        g.remove('a')
+        self.assertEqual(g.get_candidates([], 1), ['b'])
+
     @patch('builtins.print')
     def test_repr(self, *patches):
         print(repr(self.graph))
@@ -133,3 +159,95 @@ class TestDAGraph(unittest.TestCase):
             'C': ['A'],
         }
         self.assertTrue(g._has_cycle())
+
+    def test_has_cycle_returns_false_for_deep_chain(self):
+        g = DAGraph()
+        g._parents = {f'n{i}': [f'n{i + 1}'] for i in range(5000)}
+        g._parents['n5000'] = []
+        self.assertFalse(g._has_cycle())
+
+    def test_has_cycle_When_Start(self):
+        g = DAGraph()
+        g._parents = {'A': ['B'], 'B': ['A'], 'C': []}
+        g._children = {'A': {'B'}, 'B': {'A'}}
+        self.assertTrue(g._has_cycle('A'))
+        self.assertFalse(g._has_cycle('C'))
+
+    def test_has_cycle_When_StartHasAcyclicDescendants(self):
+        self.assertFalse(self.graph._has_cycle('a'))
+
+    def test_from_edges_When_AnyOrder(self):
+        g = DAGraph.from_edges({'f': ['d', 'e'], 'd': ['a'], 'e': ['b'], 'a': None, 'b': []})
+        self.assertEqual(set(g.nodes()), {'a', 'b', 'd', 'e', 'f'})
+        self.assertEqual(g.parents_of('f'), ['d', 'e'])
+        self.assertEqual(g.original_parents_of('d'), ['a'])
+        self.assertEqual(set(g.children_of('a')), {'d'})
+        self.assertEqual(g.get_candidates([], 4), ['a', 'b'])
+
+    def test_add_many_Should_ExtendExistingGraph(self):
+        self.graph.add_many([('h', ['g', 'f']), ('g', ['c'])])
+        self.assertEqual(self.graph.parents_of('h'), ['g', 'f'])
+        self.assertIn('g', self.graph.children_of('c'))
+
+    def test_add_many_Should_ReportAllErrorsTogether(self):
+        with self.assertRaises(ValueError) as error:
+            self.graph.add_many([
+                ('a', []),
+                ('g', ['x']),
+                ('h', ['i']),
+                ('i', ['j']),
+                ('j', ['h']),
+                ('k', ['k']),
+                ('m', ['n']),
+                ('m', [])])
+        self.assertEqual(
+            str(error.exception),
+            "a has already been added; m has already been added; g depends on unknown ['x']; "
+            "m depends on unknown ['n']; "
+            'cycle detected: h -> j -> i -> h; cycle detected: k -> k')
+        # nothing was added
+        self.assertNotIn('g', self.graph.nodes())
+        self.assertNotIn('m', self.graph.nodes())
+
+    def test_add_many_Should_NotReportNodesBehindCycle(self):
+        with self.assertRaises(ValueError) as error:
+            DAGraph.from_edges({'a': ['b'], 'b': ['a'], 'c': ['a']})
+        self.assertEqual(str(error.exception), 'cycle detected: a -> b -> a')
+
+    def test_upward_ranks(self):
+        ranks = self.graph.upward_ranks()
+        self.assertEqual(ranks, {'a': 3, 'b': 3, 'c': 1, 'd': 2, 'e': 2, 'f': 1})
+
+    def test_upward_ranks_When_Weights(self):
+        ranks = self.graph.upward_ranks({'c': 10, 'f': 0.5})
+        self.assertEqual(ranks['a'], 11)
+        self.assertEqual(ranks['b'], 2.5)
+
+    def test_transitive_reduction(self):
+        g = DAGraph.from_edges({
+            'a': [], 'b': ['a'], 'c': ['b', 'a'], 'd': ['a', 'c', 'b'], 'e': ['d', 'd'], 'x': []})
+        self.assertEqual(
+            g.transitive_reduction(),
+            {'a': [], 'x': [], 'b': ['a'], 'c': ['b'], 'd': ['c'], 'e': ['d']})
+
+    def test_transitive_reduction_When_WideFanIn(self):
+        edges = {f'n{i}': [] for i in range(50)}
+        edges['hub'] = [f'n{i}' for i in range(50)]
+        edges['sink'] = ['hub'] + [f'n{i}' for i in range(50)]
+        reduced = DAGraph.from_edges(edges).transitive_reduction()
+        self.assertEqual(len(reduced['hub']), 50)
+        self.assertEqual(reduced['sink'], ['hub'])
+
+    def test_compile_When_Reduce(self):
+        g = DAGraph.from_edges({'a': [], 'b': ['a'], 'c': ['a', 'b']})
+        plan = g.compile(reduce=True)
+        self.assertEqual(plan.parents_of('c'), ('b',))
+        self.assertEqual(plan.children_of('a'), ('b',))
+        self.assertEqual(plan.original_parents_of('c'), ('a', 'b'))
+        self.assertEqual(g.original_parents_of('c'), ['a', 'b'])
+
+    def test_ancestors_of(self):
+        self.assertEqual(self.graph.ancestors_of('f'), {'a', 'b', 'd', 'e'})
+        self.assertEqual(self.graph.ancestors_of('a'), set())
+        self.graph.remove('a')
+        self.assertEqual(self.graph.ancestors_of('c'), {'a'})
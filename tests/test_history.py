@@ -0,0 +1,56 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import Mock
+from thread_order.history import TimingHistory, task_key
+
+def sample_task():
+    pass
+
+class TestTimingHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'history', 'durations.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_task_key(self):
+        self.assertEqual(task_key('task1', sample_task), f'{os.path.abspath(__file__)}::task1')
+
+    def test_task_key_When_NoCode(self):
+        function_mock = Mock(spec=['__module__'], __module__='module1')
+        self.assertEqual(task_key('task1', function_mock), 'module1::task1')
+
+    def test_load_When_Missing(self):
+        history = TimingHistory(self.path)
+        self.assertIsNone(history.get('key1'))
+
+    def test_load_When_Invalid(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write('not json')
+        history = TimingHistory(self.path)
+        self.assertIsNone(history.get('key1'))
+
+    def test_record_and_save(self):
+        history = TimingHistory(self.path, smoothing=0.5)
+        history.record('key1', 2.0)
+        history.record('key1', 4.0)
+        history.save()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), {'durations': {'key1': 3.0}})
+        self.assertEqual(TimingHistory(self.path).get('key1'), 3.0)
+
+    def test_weights(self):
+        history = TimingHistory(self.path)
+        history.record('key1', 2.0)
+        history.record('key2', 4.0)
+        weights = history.weights({'a': 'key1', 'b': 'key2', 'c': 'key3'})
+        self.assertEqual(weights, {'a': 2.0, 'b': 4.0, 'c': 3.0})
+
+    def test_weights_When_Empty(self):
+        history = TimingHistory(self.path)
+        self.assertEqual(history.weights({'a': 'key1', 'b': 'key2'}), {'a': 1, 'b': 1})
@@ -0,0 +1,112 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from thread_order.journal import Journal, journal_path, read_journal
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'journals', 'run.jsonl')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_append_and_read(self):
+        journal = Journal(self.path)
+        journal.open()
+        journal.append('a', 'PASSED', {'rows': 3}, True)
+        journal.append('b', 'PASSED', threading.Lock(), True)
+        journal.append('c', 'FAILED')
+        journal.append('d', 'PASSED', None, True)
+        journal.close()
+        statuses, results = read_journal(self.path)
+        self.assertEqual(statuses, {'a': 'PASSED', 'b': 'PASSED', 'c': 'FAILED', 'd': 'PASSED'})
+        # results that cannot be stored as JSON are left out
+        self.assertEqual(results, {'a': {'rows': 3}, 'd': None})
+
+    def test_read_When_Appended(self):
+        for status in ('PASSED', 'FAILED'):
+            journal = Journal(self.path)
+            journal.open()
+            journal.append('a', status, 1, status == 'PASSED')
+            journal.close()
+        self.assertEqual(read_journal(self.path), ({'a': 'FAILED'}, {}))
+
+    def test_read_When_LastLineCutShort(self):
+        journal = Journal(self.path)
+        journal.open()
+        journal.append('a', 'PASSED', 1, True)
+        journal.close()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"name": "b", "sta')
+        self.assertEqual(read_journal(self.path), ({'a': 'PASSED'}, {'a': 1}))
+
+    def wait_for(self, mock, count):
+        # the journal syncs on a thread of its own
+        deadline = time.monotonic() + 5
+        while mock.call_count < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return mock.call_count
+
+    @patch('thread_order.journal.os.fsync')
+    def test_append_When_Batched(self, fsync_patch):
+        journal = Journal(self.path, sync_every=3, sync_interval=60)
+        journal.open()
+        for name in 'abc':
+            journal.append(name, 'PASSED')
+        self.assertEqual(self.wait_for(fsync_patch, 1), 1)
+        journal.append('d', 'PASSED')
+        time.sleep(0.05)
+        self.assertEqual(fsync_patch.call_count, 1)
+        journal.close()
+        self.assertEqual(fsync_patch.call_count, 2)
+
+    @patch('thread_order.journal.os.fsync')
+    def test_append_When_IntervalPassed(self, fsync_patch):
+        journal = Journal(self.path, sync_every=100, sync_interval=0.05)
+        journal.open()
+        journal.append('a', 'PASSED')
+        self.assertEqual(fsync_patch.call_count, 0)
+        self.assertEqual(self.wait_for(fsync_patch, 1), 1)
+        journal.close()
+        self.assertEqual(fsync_patch.call_count, 1)
+
+    @patch('thread_order.journal.os.fsync')
+    def test_append_When_SyncBlocks(self, fsync_patch):
+        release = threading.Event()
+        fsync_patch.side_effect = lambda fd: release.wait(5)
+        journal = Journal(self.path, sync_every=1, sync_interval=60)
+        journal.open()
+        journal.append('a', 'PASSED')
+        self.wait_for(fsync_patch, 1)
+        # appending goes on while the disk is busy
+        journal.append('b', 'PASSED')
+        release.set()
+        journal.close()
+        self.assertEqual(read_journal(self.path)[0], {'a': 'PASSED', 'b': 'PASSED'})
+
+    def test_append_When_Serialized(self):
+        from json import dumps as json_dumps
+        threads = []
+
+        def dumps(value):
+            threads.append(threading.current_thread().name)
+            return json_dumps(value)
+
+        journal = Journal(self.path)
+        journal.open()
+        with patch('thread_order.journal.json.dumps', side_effect=dumps):
+            journal.append('a', 'PASSED', [1], True)
+            journal.append('b', 'FAILED')
+            journal.close()
+        # encoded and written on the journal's thread, never by the caller
+        self.assertEqual(threads, ['journal', 'journal'])
+        self.assertEqual(read_journal(self.path), ({'a': 'PASSED', 'b': 'FAILED'}, {'a': [1]}))
+
+    def test_journal_path(self):
+        self.assertEqual(journal_path('cache', 'a.py'), journal_path('cache', os.path.abspath('a.py')))
+        self.assertNotEqual(journal_path('cache', 'a.py'), journal_path('cache', 'b.py'))
@@ -0,0 +1,114 @@
+import unittest
+from thread_order.graph import DAGraph
+from thread_order.plan import ExecutionPlan
+
+class TestExecutionPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = DAGraph.from_edges({
+            'a': [], 'b': [], 'c': ['a'], 'd': ['a'], 'e': ['b'], 'f': ['d', 'e']}).compile()
+
+    def test_views(self):
+        self.assertEqual(len(self.plan), 6)
+        self.assertEqual(set(self.plan.nodes()), {'a', 'b', 'c', 'd', 'e', 'f'})
+        self.assertEqual(self.plan.parents_of('f'), ('d', 'e'))
+        self.assertEqual(self.plan.children_of('a'), ('c', 'd'))
+        self.assertEqual(self.plan.original_parents_of('f'), ('d', 'e'))
+        self.assertEqual(self.plan.parents_of('unknown'), ())
+
+    def test_original_parents(self):
+        plan = ExecutionPlan({'a': [], 'b': ['a']}, original_parents={'a': [], 'b': ['a', 'a']})
+        self.assertEqual(plan.parents_of('b'), ('a',))
+        self.assertEqual(plan.original_parents_of('b'), ('a', 'a'))
+
+    def test_cursor(self):
+        cursor = self.plan.cursor()
+        self.assertEqual(cursor.get_candidates(set(), 4), ['a', 'b'])
+        self.assertEqual(cursor.get_candidates(set(), 4), [])
+        cursor.remove('a')
+        cursor.remove('a')
+        self.assertEqual(cursor.get_candidates(set(), 1), ['c'])
+        self.assertEqual(cursor.get_candidates({'d'}, 1), [])
+        cursor.remove('d')
+        cursor.remove('b')
+        cursor.remove('e')
+        self.assertEqual(cursor.get_candidates(set(), 4), ['f'])
+        self.assertFalse(cursor.is_empty())
+        cursor.remove('c')
+        cursor.remove('f')
+        self.assertTrue(cursor.is_empty())
+
+    def test_cursor_When_Reused(self):
+        first = self.plan.cursor()
+        for name in ['a', 'b', 'c', 'd', 'e', 'f']:
+            first.remove(name)
+        second = self.plan.cursor()
+        self.assertTrue(first.is_empty())
+        self.assertFalse(second.is_empty())
+        self.assertEqual(second.get_candidates(set(), 4), ['a', 'b'])
+
+    def test_cursor_When_Ranks(self):
+        plan = DAGraph.from_edges({'a': [], 'z': [], 'z1': ['z']}).compile({'z': 2, 'a': 1, 'z1': 1})
+        self.assertEqual(plan.cursor().get_candidates(set(), 2), ['z', 'a'])
+
+    def test_reranked(self):
+        plan = DAGraph.from_edges({'a': [], 'z': [], 'z1': ['z']}).compile({'z': 2, 'a': 1, 'z1': 1})
+        reranked = plan.reranked({'a': 3, 'z': 2, 'z1': 1})
+        self.assertEqual(reranked.cursor().get_candidates(set(), 2), ['a', 'z'])
+        self.assertEqual(reranked.children_of('z'), ('z1',))
+        # the original plan keeps its ranks
+        self.assertEqual(plan.cursor().get_candidates(set(), 2), ['z', 'a'])
+
+    def test_cursor_When_Admit(self):
+        plan = DAGraph.from_edges({'a': [], 'b': [], 'c': [], 'd': ['a']}).compile({'d': 0, 'a': 1})
+        cursor = plan.cursor()
+        free = {'slot': 1}
+
+        def admit(name):
+            if free['slot']:
+                free['slot'] -= 1
+                return None
+            return 'slot'
+
+        self.assertEqual(cursor.get_candidates(set(), admit=admit), ['a'])
+        # b and c are parked on 'slot' and not reconsidered until it is released
+        self.assertEqual(cursor.get_candidates(set(), admit=admit), [])
+        cursor.remove('a')
+        free['slot'] += 1
+        cursor.release('slot')
+        # parked nodes compete with newly ready ones by priority
+        self.assertEqual(cursor.get_candidates(set(), admit=admit), ['b'])
+        cursor.remove('b')
+        free['slot'] += 1
+        cursor.release('slot')
+        self.assertEqual(cursor.get_candidates(set(), admit=admit), ['c'])
+        free['slot'] += 1
+        cursor.release('slot')
+        self.assertEqual(cursor.get_candidates(set(), admit=admit), ['d'])
+
+    def test_cursor_requeue(self):
+        cursor = self.plan.cursor()
+        self.assertEqual(cursor.get_candidates(set(), 1), ['a'])
+        cursor.requeue('a')
+        self.assertEqual(cursor.get_candidates(set(), 1), ['a'])
+        cursor.remove('a')
+        cursor.requeue('a')
+        self.assertEqual(cursor.get_candidates(set(), 4), ['b', 'c', 'd'])
+
+    def test_descendants_of(self):
+        self.assertEqual(self.plan.descendants_of('a'), ('c', 'd', 'f'))
+        self.assertEqual(self.plan.descendants_of('b'), ('e', 'f'))
+        self.assertEqual(self.plan.descendants_of('f'), ())
+        self.assertIs(self.plan.descendants_of('a'), self.plan.descendants_of('a'))
+
+    def test_cursor_prune(self):
+        cursor = self.plan.cursor()
+        self.assertEqual(cursor.get_candidates(set(), 4), ['a', 'b'])
+        self.assertEqual(cursor.prune('b'), ['e', 'f'])
+        cursor.remove('b')
+        self.assertEqual(cursor.prune('b'), [])
+        cursor.remove('a')
+        self.assertEqual(cursor.get_candidates(set(), 4), ['c', 'd'])
+        cursor.remove('c')
+        cursor.remove('d')
+        self.assertTrue(cursor.is_empty())
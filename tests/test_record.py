@@ -0,0 +1,83 @@
+import tempfile
+import threading
+import unittest
+from thread_order.record import RunRecord, select_rerun
+
+class TestRunRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.functions = [
+            ('a', None, {'after': []}),
+            ('b', None, {'after': []}),
+            ('c', None, {'after': ['a', 'b']}),
+            ('d', None, {'after': ['c']}),
+            ('e', None, {'after': []}),
+            ('f', None, {'after': ['e', 'filtered']}),
+        ]
+        self.summary = {
+            'passed': ['a', 'b', 'e'],
+            'failed': ['c'],
+            'skipped': ['d'],
+        }
+        self.results = {'a': {'rows': 3}, 'b': threading.Lock(), 'e': None}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def record(self):
+        return RunRecord(self.tmpdir.name, 'module.py')
+
+    def test_load_When_Missing(self):
+        record = self.record()
+        self.assertEqual(record.statuses, {})
+        self.assertEqual(record.results, {})
+
+    def test_update_and_save(self):
+        record = self.record()
+        record.update([name for name, _, _ in self.functions], self.summary, self.results)
+        record.save()
+        record = self.record()
+        self.assertEqual(record.statuses, {
+            'a': 'PASSED', 'b': 'PASSED', 'c': 'FAILED', 'd': 'SKIPPED', 'e': 'PASSED'})
+        # results that cannot be stored as JSON are left out
+        self.assertEqual(record.results, {'a': {'rows': 3}, 'e': None})
+
+    def test_update_When_PartialRun(self):
+        record = self.record()
+        record.update([name for name, _, _ in self.functions], self.summary, self.results)
+        record.update(['c'], {'passed': ['c']}, {'c': 6})
+        self.assertEqual(record.statuses['c'], 'PASSED')
+        self.assertEqual(record.statuses['a'], 'PASSED')
+        self.assertEqual(record.results['c'], 6)
+        # a function the run never got to is forgotten
+        record.update(['a'], {}, {})
+        self.assertNotIn('a', record.statuses)
+        self.assertNotIn('a', record.results)
+
+    def test_select_failed(self):
+        record = self.record()
+        record.update([name for name, _, _ in self.functions], self.summary, self.results)
+        functions, results = record.select_failed(self.functions)
+        # f never ran; b passed but its result was not stored so it runs again
+        self.assertEqual([name for name, _, _ in functions], ['b', 'c', 'd', 'f'])
+        self.assertEqual(results, {'a': {'rows': 3}, 'e': None})
+        after = {name: meta['after'] for name, _, meta in functions}
+        self.assertEqual(after, {'b': [], 'c': ['b'], 'd': ['c'], 'f': []})
+
+    def test_select_failed_When_AllPassed(self):
+        record = self.record()
+        record.update(['a', 'b'], {'passed': ['a', 'b']}, {'a': 1, 'b': 2})
+        self.assertEqual(record.select_failed(self.functions[:2]), ([], {}))
+
+    def test_merge(self):
+        record = self.record()
+        record.update([name for name, _, _ in self.functions], self.summary, self.results)
+        record.merge({'a': 'PASSED', 'c': 'PASSED'}, {'c': 6})
+        self.assertEqual(record.statuses['c'], 'PASSED')
+        self.assertEqual(record.results, {'c': 6, 'e': None})
+
+    def test_select_rerun(self):
+        functions, results = select_rerun(self.functions, {'a': 'PASSED', 'b': 'PASSED'}, {'a': 1})
+        self.assertEqual([name for name, _, _ in functions], ['b', 'c', 'd', 'e', 'f'])
+        self.assertEqual(results, {'a': 1})
@@ -1,13 +1,25 @@
 import os
 import sys
+import time
 import queue
+import asyncio
+import inspect
+import tempfile
+import threading
+import textwrap
 import unittest
 import argparse
+import subprocess
 from unittest.mock import patch
 from unittest.mock import call
 from unittest.mock import Mock
 from thread_order.scheduler import (
-    Scheduler,dmark, mark, TaskStatus, _split_target, _load_module, _collect_functions, load_and_collect_functions)
+    Scheduler,dmark, mark, TaskStatus, IDLE_WAKEUP, _split_target, _load_module, _collect_functions, load_and_collect_functions,
+    build_graph, register_functions)
+from thread_order.journal import read_journal
+
+# recorded by cached tasks; a list they closed over would be part of their cache key
+CALLS = []
 
 class TestScheduler(unittest.TestCase):
 
@@ -16,6 +28,897 @@ class TestScheduler(unittest.TestCase):
         Scheduler(setup_logging=True)
         configure_logging_patch.assert_called_once()
 
+    def test_init_ValueError_When_UnknownPolicy(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler(policy='random')
+
+    def test_init_ValueError_When_UnknownExecutor(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler(executor='fiber')
+
+    def test_start_When_AsyncExecutor(self, *patches):
+        s = Scheduler(executor='async')
+        order = []
+
+        async def fetch(state):
+            await asyncio.sleep(0.2)
+            return 1
+
+        async def total(state):
+            order.append('total')
+            return sum(value for key, value in state['results'].items() if key != 'total')
+
+        def report():
+            order.append('report')
+            return 'sync'
+
+        s.register_many({f'fetch{i}': (fetch, None, True) for i in range(200)})
+        s.register(total, 'total', after=[f'fetch{i}' for i in range(200)], with_state=True)
+        s.register(report, 'report', after=['total'])
+        started = time.perf_counter()
+        summary = s.start()
+        # all 200 waits overlap on the one event loop
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(order, ['total', 'report'])
+        self.assertEqual(s.state['results']['total'], 200)
+        self.assertEqual(s.state['results']['report'], 'sync')
+
+    def test_start_When_AsyncExecutorTaskFails(self, *patches):
+        s = Scheduler(executor='async', skip_dependents=True)
+
+        async def fail():
+            raise RuntimeError('boom')
+
+        s.register(fail, 'fail')
+        s.register(Mock(__name__='after'), 'after', after=['fail'])
+        summary = s.start()
+        self.assertEqual(summary['failed'], ['fail'])
+        self.assertEqual(summary['skipped'], ['after'])
+        self.assertEqual(summary['failures']['fail']['error_type'], 'RuntimeError')
+
+    def test_start_When_CoroutineOnThreadExecutor(self, *patches):
+        s = Scheduler(workers=2)
+
+        @s.dregister()
+        async def task():
+            await asyncio.sleep(0)
+            return 'done'
+
+        self.assertTrue(inspect.iscoroutinefunction(task))
+        summary = s.start()
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(s.state['results']['task'], 'done')
+
+    def test_start_When_ProcessExecutor(self, *patches):
+        source = textwrap.dedent('''
+            import os
+            from thread_order import mark
+
+            @mark()
+            def numbers(state):
+                state['leaked'] = True
+                return list(range(10))
+
+            @mark(after=['numbers'])
+            def squares(state):
+                return sum(n * n for n in state['results']['numbers']), os.getpid()
+
+            @mark(with_state=False, executor='thread')
+            def pid():
+                return os.getpid()
+        ''')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'process_tasks.py')
+            with open(path, 'w') as f:
+                f.write(source)
+            try:
+                _, functions, single = load_and_collect_functions(path)
+                s = Scheduler(workers=2, executor='process')
+                register_functions(s, functions, None, single)
+                summary = s.start()
+            finally:
+                sys.modules.pop('process_tasks', None)
+        self.assertEqual(summary['failed'], [])
+        total, child_pid = s.state['results']['squares']
+        self.assertEqual(total, 285)
+        self.assertNotEqual(child_pid, os.getpid())
+        # the task overrides the scheduler's executor
+        self.assertEqual(s.state['results']['pid'], os.getpid())
+        # workers get a copy of state; their changes do not flow back
+        self.assertNotIn('leaked', s.state)
+
+    def test_start_When_ProcessExecutorTaskNotPicklable(self, *patches):
+        s = Scheduler(workers=1, executor='process')
+        s.register(lambda: 1, 'task')
+        summary = s.start()
+        self.assertEqual(summary['failed'], ['task'])
+
+    def test_process_state(self, *patches):
+        s = Scheduler(state={'env': 'dev'})
+        s.register(Mock(), 'a')
+        s.register(Mock(), 'b')
+        s.register(Mock(), 'c', after=['a'])
+        s.state['results'].update({'a': 1, 'b': 2})
+        self.assertEqual(s._process_state('c'), {'env': 'dev', 'results': {'a': 1}})
+
+    def test_init_ValueError_When_InvalidWorkers(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler(workers={'fiber': 2})
+        with self.assertRaises(ValueError):
+            Scheduler(workers={'thread': 0})
+
+    def test_register_ValueError_When_InvalidOptions(self, *patches):
+        s = Scheduler()
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'task', priority=1)
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'task', executor='fiber')
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'task', timeout=0)
+
+    def test_start_When_MixedExecutors(self, *patches):
+        s = Scheduler(workers={'thread': 1, 'async': 50})
+        threads = {}
+
+        async def fetch():
+            threads['fetch'] = threading.current_thread().name
+            await asyncio.sleep(0.2)
+
+        def build():
+            threads['build'] = threading.current_thread().name
+
+        s.register_many({f'fetch{i}': (fetch, None, False, {'executor': 'async'}) for i in range(50)})
+        s.register(build, 'build', after=[f'fetch{i}' for i in range(50)])
+        started = time.perf_counter()
+        summary = s.start()
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(threads, {'fetch': 'async_0', 'build': 'thread_0'})
+
+    def test_start_When_ThreadExecutorIsNotDefault(self, *patches):
+        for executor in ('process', 'async'):
+            s = Scheduler(workers=1, executor=executor)
+            threads = {}
+            s.on_task_run(lambda name, thread: threads.update({name: thread}))
+            s.register(os.getpid, 'default')
+            s.register(os.getpid, 'thread', executor='thread')
+            summary = s.start()
+            self.assertEqual(summary['failed'], [])
+            self.assertEqual(threads, {'default': 'thread_0', 'thread': 'thread_pool_0'})
+
+    def test_start_When_PoolIsFull(self, *patches):
+        s = Scheduler(workers={'thread': 2, 'async': 1})
+        running = {'thread': 0, 'async': 0}
+        peak = {'thread': 0, 'async': 0}
+        lock = threading.Lock()
+
+        def enter(kind):
+            with lock:
+                running[kind] += 1
+                peak[kind] = max(peak[kind], running[kind])
+
+        def leave(kind):
+            with lock:
+                running[kind] -= 1
+
+        async def fetch():
+            enter('async')
+            await asyncio.sleep(0.02)
+            leave('async')
+
+        def build():
+            enter('thread')
+            time.sleep(0.02)
+            leave('thread')
+
+        for i in range(4):
+            s.register(fetch, f'fetch{i}', executor='async')
+            s.register(build, f'build{i}')
+        summary = s.start()
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(peak, {'thread': 2, 'async': 1})
+
+    def test_init_ValueError_When_InvalidTaskTimeout(self, *patches):
+        for timeout in (0, -1, '5', True):
+            with self.assertRaises(ValueError):
+                Scheduler(task_timeout=timeout)
+
+    def test_start_When_TaskTimesOut(self, *patches):
+        s = Scheduler(workers=1, skip_dependents=True, task_timeout=0.2)
+        hang = threading.Event()
+        s.register(lambda: hang.wait(10), 'hung')
+        s.register(Mock(__name__='dependent'), 'dependent', after=['hung'])
+        s.register(Mock(__name__='quick', return_value=1), 'quick', timeout=5)
+        started = time.perf_counter()
+        summary = s.start()
+        hang.set()
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(summary['failed'], ['hung'])
+        self.assertEqual(summary['failures']['hung'], {'error_type': 'TimeoutError', 'error': 'timed out after 0.2s'})
+        self.assertEqual(summary['skipped'], ['dependent'])
+        # the slot held by the hung task was freed for the one worker
+        self.assertEqual(s.state['results']['quick'], 1)
+        self.assertNotIn('hung', s.state['results'])
+
+    def test_start_When_AsyncTaskTimesOut(self, *patches):
+        s = Scheduler(executor='async')
+
+        async def hang():
+            await asyncio.sleep(10)
+
+        s.register(hang, 'hang', timeout=0.1)
+        summary = s.start()
+        self.assertEqual(summary['failures']['hang']['error_type'], 'TimeoutError')
+
+    def test_start_When_AsyncExecutorPlainTaskTimesOut(self, *patches):
+        source = textwrap.dedent('''
+            import time
+            from thread_order import Scheduler
+
+            s = Scheduler(executor='async')
+            s.register(lambda: time.sleep(30), 'hang', timeout=0.2)
+            s.register(lambda: 1, 'quick', timeout=5)
+            summary = s.start()
+            print(summary['failed'], s.state['results'])
+        ''')
+        started = time.perf_counter()
+        # the abandoned task keeps sleeping, yet the interpreter exits right away
+        output = subprocess.run(
+            [sys.executable, '-c', source], capture_output=True, text=True, timeout=20,
+            env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)})
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertEqual(output.stdout.strip(), "['hang'] {'quick': 1}")
+
+    def test_start_When_ProcessTaskTimesOut(self, *patches):
+        source = textwrap.dedent('''
+            import time
+            from thread_order import mark
+
+            @mark(with_state=False, timeout=0.5)
+            def hang():
+                time.sleep(30)
+
+            @mark(timeout=10)
+            def quick(state):
+                return state['value'] * 2
+        ''')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'timed_tasks.py')
+            with open(path, 'w') as f:
+                f.write(source)
+            try:
+                _, functions, single = load_and_collect_functions(path)
+                s = Scheduler(workers=2, executor='process', state={'value': 21})
+                register_functions(s, functions, None, single)
+                started = time.perf_counter()
+                summary = s.start()
+            finally:
+                sys.modules.pop('timed_tasks', None)
+        self.assertLess(time.perf_counter() - started, 10)
+        self.assertEqual(summary['failed'], ['hang'])
+        self.assertEqual(summary['failures']['hang']['error_type'], 'TimeoutError')
+        self.assertEqual(s.state['results']['quick'], 42)
+
+    def test_start_When_Retries(self, *patches):
+        s = Scheduler(workers=1)
+        calls = []
+
+        def flaky():
+            calls.append('flaky')
+            if calls.count('flaky') < 3:
+                raise ConnectionError('reset')
+            return 'ok'
+
+        def other():
+            calls.append('other')
+
+        s.register(flaky, 'flaky', retries=3, backoff=0.1)
+        s.register(other, 'other')
+        s.register(Mock(__name__='always', side_effect=ValueError('bad')), 'always', retries=1)
+        summary = s.start()
+        self.assertEqual(sorted(summary['passed']), ['flaky', 'other'])
+        self.assertEqual(summary['failed'], ['always'])
+        self.assertEqual(summary['attempts'], {'always': 2, 'flaky': 3, 'other': 1})
+        self.assertEqual(s.state['results']['flaky'], 'ok')
+        # the one worker ran other while flaky waited for its retry
+        self.assertLess(calls.index('other'), len(calls) - 1)
+
+    def test_register_ValueError_When_InvalidRetries(self, *patches):
+        s = Scheduler()
+        for options in ({'retries': -1}, {'retries': 1.5}, {'backoff': -1}, {'backoff': 'x'}):
+            with self.assertRaises(ValueError):
+                s.register(Mock(), 'task', **options)
+
+    def test_handle_interrupt_When_Waiting(self, *patches):
+        s = Scheduler()
+        s._cursor = Mock()
+        s._waiting.add('task1')
+        s._timers.append((0, 1, 'task1'))
+        s._handle_interrupt(Mock())
+        self.assertEqual(s._failed, ['task1'])
+        self.assertEqual(s._timers, [])
+
+    def test_start_When_Resources(self, *patches):
+        s = Scheduler(workers=3, resources={'db': 1, 'license': 2})
+        running = set()
+        peak = {'db': 0, 'license': 0, 'all': 0}
+        lock = threading.Lock()
+
+        def task(name, resources):
+            def run():
+                with lock:
+                    running.add(name)
+                    peak['all'] = max(peak['all'], len(running))
+                    for resource in resources:
+                        count = sum(1 for n in running if resource in n)
+                        peak[resource] = max(peak[resource], count)
+                time.sleep(0.05)
+                with lock:
+                    running.discard(name)
+            return run
+
+        for i in range(3):
+            s.register(task(f'db{i}', ['db']), f'db{i}', resources={'db': 1})
+            s.register(task(f'license{i}', ['license']), f'license{i}', resources={'license': 1})
+            s.register(task(f'plain{i}', []), f'plain{i}')
+        summary = s.start()
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(peak, {'db': 1, 'license': 2, 'all': 3})
+
+    def test_start_ValueError_When_ResourcesUnavailable(self, *patches):
+        s = Scheduler(resources={'db': 1})
+        s.register(Mock(), 'a', resources={'db': 2})
+        s.register(Mock(), 'b', resources={'gpu': 1})
+        with self.assertRaises(ValueError) as context:
+            s.start()
+        self.assertEqual(str(context.exception), "a claims 2 'db' tokens but there are only 1; b claims unknown resource 'gpu'")
+        with self.assertRaises(ValueError):
+            Scheduler(resources={'db': 0})
+
+    def test_start_When_Exclusive(self, *patches):
+        s = Scheduler(workers=4)
+        running = set()
+        overlaps = []
+        lock = threading.Lock()
+
+        def task(name, group):
+            def run():
+                with lock:
+                    if group and any(n.startswith(group) for n in running):
+                        overlaps.append(name)
+                    running.add(name)
+                time.sleep(0.05)
+                with lock:
+                    running.discard(name)
+            return run
+
+        for i in range(3):
+            s.register(task(f'schema_x{i}', 'schema_x'), f'schema_x{i}', exclusive='schema_x')
+            s.register(task(f'other{i}', None), f'other{i}')
+        s.register(task('both', 'schema_x'), 'both', exclusive=['schema_x', 'schema_y'])
+        summary = s.start()
+        self.assertEqual(summary['failed'], [])
+        # the group runs one at a time, in no particular order
+        self.assertEqual(overlaps, [])
+
+    def test_register_ValueError_When_InvalidExclusive(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler().register(Mock(), 'task', exclusive=1)
+
+    def test_start_When_Slots(self, *patches):
+        s = Scheduler(workers=4)
+        events = []
+        lock = threading.Lock()
+        running = {'slots': 0, 'peak': 0}
+
+        def task(name, slots):
+            def run():
+                with lock:
+                    running['slots'] += slots
+                    running['peak'] = max(running['peak'], running['slots'])
+                    events.append(name)
+                time.sleep(0.02)
+                with lock:
+                    running['slots'] -= slots
+            return run
+
+        # light tasks sort first, so without a reservation they would keep the heavy task
+        # waiting until every one of them has run
+        for i in range(12):
+            s.register(task(f'light{i}', 1), f'light{i:02}')
+        s.register(task('zheavy', 4), 'zheavy', slots=4)
+        summary = s.start()
+        self.assertEqual(summary['failed'], [])
+        self.assertEqual(running['peak'], 4)
+        self.assertLess(events.index('zheavy'), 8)
+
+    def test_admit_When_Backfill(self, *patches):
+        s = Scheduler(workers=4)
+        for name in ('long', 'short', 'slow'):
+            s.register(Mock(), name)
+        s.register(Mock(), 'heavy', slots=4)
+        s._prep_start()
+        s._estimates = {'long': 10, 'short': 1, 'slow': 20}
+        key = ('executor', 'thread')
+        self.assertIsNone(s._admit('long'))
+        self.assertEqual(s._admit('heavy'), key)
+        self.assertEqual(s._reservations, {key: ('heavy', 4)})
+        # short is done before long frees the slot heavy needs; slow is not
+        self.assertIsNone(s._admit('short'))
+        self.assertEqual(s._admit('slow'), ('reserved', key))
+        s._release('long')
+        s._release('short')
+        self.assertIsNone(s._admit('heavy'))
+        self.assertEqual(s._reservations, {})
+
+    def test_start_When_ReservationsOnDifferentKeys(self, *patches):
+        s = Scheduler(workers=4, resources={'db': 2})
+        s.register(lambda: time.sleep(0.2), '0_r1', resources={'db': 1})
+        # heavy reserves the thread slots and b_db the db tokens while 0_r1 runs
+        s.register(Mock(__name__='a_heavy'), 'a_heavy', slots=4, resources={'db': 1})
+        s.register(Mock(__name__='b_db'), 'b_db', resources={'db': 2})
+        summaries = []
+        runner = threading.Thread(target=lambda: summaries.append(s.start()), daemon=True)
+        runner.start()
+        runner.join(5)
+        self.assertFalse(runner.is_alive(), 'reserving tasks blocked each other')
+        self.assertEqual(sorted(summaries[0]['passed']), ['0_r1', 'a_heavy', 'b_db'])
+        self.assertEqual(s._reservations, {})
+
+    def test_start_ValueError_When_TooManySlots(self, *patches):
+        s = Scheduler(workers=2)
+        s.register(Mock(), 'task', slots=3)
+        with self.assertRaises(ValueError):
+            s.start()
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'other', slots=0)
+
+    def test_start_When_MaxFailures(self, *patches):
+        s = Scheduler(workers=2, max_failures=1)
+
+        def long(state):
+            # cooperates with cancellation instead of running to the end
+            return state['_cancel'].wait(10)
+
+        def bad():
+            time.sleep(0.05)
+            raise ValueError('bad')
+
+        s.register(long, 'a_long', with_state=True)
+        s.register(bad, 'b_bad')
+        for i in range(5):
+            s.register(Mock(__name__=f'later{i}'), f'later{i}')
+        started = time.perf_counter()
+        summary = s.start()
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(summary['failed'], ['b_bad'])
+        self.assertEqual(summary['passed'], ['a_long'])
+        self.assertIs(s.state['results']['a_long'], True)
+        # nothing new was dispatched once the limit was reached
+        self.assertEqual(sorted(summary['ran']), ['a_long', 'b_bad'])
+        # a new run starts uncancelled
+        self.assertEqual(s.start()['failed'], ['b_bad'])
+
+    def test_start_When_MaxFailuresAndRetrying(self, *patches):
+        s = Scheduler(workers=2, max_failures=1)
+
+        def slow_bad():
+            time.sleep(0.3)
+            raise ValueError('slow')
+
+        s.register(Mock(side_effect=ValueError('bad'), __name__='a'), 'a')
+        s.register(slow_bad, 'b', retries=2, backoff=0.1)
+        summaries = []
+        runner = threading.Thread(target=lambda: summaries.append(s.start()), daemon=True)
+        runner.start()
+        runner.join(5)
+        self.assertFalse(runner.is_alive(), 'run waited on a retry that was never dispatched')
+        # b failed after the run was cancelled, so it is not retried but still reported
+        self.assertEqual(sorted(summaries[0]['failed']), ['a', 'b'])
+        self.assertEqual(summaries[0]['attempts']['b'], 1)
+
+    def test_init_ValueError_When_InvalidMaxFailures(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler(max_failures=0)
+
+    def test_start_When_ResultCache(self, *patches):
+        CALLS.clear()
+
+        def a():
+            CALLS.append('a')
+            return 1
+
+        def b(state):
+            CALLS.append('b')
+            return state['results']['a'] + state['factor']
+
+        def c(state):
+            CALLS.append('c')
+            return state['results']['b']
+
+        def run(directory, factor):
+            s = Scheduler(workers=2, cache_dir=directory, state={'factor': factor})
+            s.register(a, 'a', cache=True)
+            s.register(b, 'b', after=['a'], with_state=True, cache=True, cache_inputs=['factor'])
+            s.register(c, 'c', after=['b'], with_state=True)
+            done = []
+            s.on_task_done(lambda name, thread, status, count: done.append((name, status)))
+            return s.start(), s.state['results'], done
+
+        with tempfile.TemporaryDirectory() as directory:
+            summary, _, _ = run(directory, 10)
+            self.assertEqual(summary['passed'], ['a', 'b', 'c'])
+            self.assertEqual(summary['cached'], [])
+            self.assertEqual(CALLS, ['a', 'b', 'c'])
+            CALLS.clear()
+            summary, results, done = run(directory, 10)
+            self.assertEqual(CALLS, ['c'])
+            self.assertEqual(summary['cached'], ['a', 'b'])
+            self.assertEqual(summary['passed'], ['c'])
+            self.assertEqual(results, {'a': 1, 'b': 11, 'c': 11})
+            self.assertIn(('b', TaskStatus.CACHED), done)
+            self.assertIn('2 cached', summary['text'])
+            CALLS.clear()
+            # a changed state input invalidates the task but not its dependencies
+            summary, results, _ = run(directory, 20)
+            self.assertEqual(CALLS, ['b', 'c'])
+            self.assertEqual(results['c'], 21)
+
+    def test_start_When_ResultCacheAndFactoryTasks(self, *patches):
+        def make(value):
+            def task():
+                return value
+            return task
+
+        def shared():
+            return len(threading.current_thread().name)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for _ in range(2):
+                s = Scheduler(workers=1, cache_dir=directory)
+                for i in range(3):
+                    s.register(make(i * 10), f't{i}', cache=True)
+                # one function under two names
+                s.register(shared, 'u0', cache=True)
+                s.register(shared, 'u1', cache=True)
+                summary = s.start()
+                results = s.state['results']
+                self.assertEqual({name: results[name] for name in ('t0', 't1', 't2')},
+                                 {'t0': 0, 't1': 10, 't2': 20})
+            # nothing was taken from another task's entry, and every one was reused
+            self.assertEqual(sorted(summary['cached']), ['t0', 't1', 't2', 'u0', 'u1'])
+
+    def test_start_When_ResultCacheOffSchedulerThread(self, *patches):
+        from thread_order.cache import ResultCache
+        threads = []
+        load, save = ResultCache.load, ResultCache.save
+
+        def record(method):
+            def wrapper(*args):
+                threads.append((method.__name__, threading.current_thread().name))
+                return method(*args)
+            return wrapper
+
+        def digest(value):
+            threads.append(('digest', threading.current_thread().name))
+            return 'digest'
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.object(ResultCache, 'load', record(load)), \
+                patch.object(ResultCache, 'save', record(save)), \
+                patch('thread_order.scheduler.value_digest', side_effect=digest):
+            for _ in range(2):
+                s = Scheduler(workers=1, cache_dir=directory)
+                s.register(Mock(return_value=1, __name__='parent'), 'parent')
+                s.register(lambda state: 2, 'child', after=['parent'], with_state=True,
+                           cache=True)
+                s.start()
+                self.assertEqual(s.state['results']['child'], 2)
+        # the parent's result is digested and the child's saved by the worker that ran
+        # them; lookups run on the lookup thread
+        self.assertEqual(threads, [
+            ('digest', 'thread_0'), ('load', 'lookup_0'), ('save', 'thread_0'),
+            ('digest', 'thread_0'), ('load', 'lookup_0')])
+
+    def test_start_When_ResultCacheAndUpstreamChanged(self, *patches):
+        upstream = {'value': 1}
+        CALLS.clear()
+
+        def child(state):
+            CALLS.append('child')
+            return state['results']['parent'] * 2
+
+        with tempfile.TemporaryDirectory() as directory:
+            for value, expected in [(1, 2), (1, 2), (3, 6)]:
+                upstream['value'] = value
+                s = Scheduler(cache_dir=directory)
+                s.register(lambda: upstream['value'], 'parent')
+                s.register(child, 'child', after=['parent'], with_state=True, cache=True)
+                s.start()
+                self.assertEqual(s.state['results']['child'], expected)
+        self.assertEqual(CALLS, ['child', 'child'])
+
+    def test_start_When_InputsAndOutputs(self, *patches):
+        calls = []
+
+        def copy(source, target, name):
+            calls.append(name)
+            with open(source, encoding='utf-8') as f:
+                text = f.read()
+            with open(target, 'w', encoding='utf-8') as f:
+                f.write(text)
+
+        with tempfile.TemporaryDirectory() as directory:
+            src, out, pkg = (os.path.join(directory, name) for name in ('src', 'out', 'pkg'))
+
+            def age(path, seconds):
+                mtime = os.stat(path).st_mtime - seconds
+                os.utime(path, (mtime, mtime))
+
+            def run():
+                calls.clear()
+                s = Scheduler(cache_dir=os.path.join(directory, 'cache'))
+                s.register(lambda: copy(src, out, 'build'), 'build',
+                           inputs=[os.path.join(directory, 's*')], outputs=[out])
+                s.register(lambda: copy(out, pkg, 'pack') or 'pkg', 'pack', after=['build'],
+                           inputs=[out], outputs=[pkg])
+                # reads the result of pack whether or not pack ran
+                s.register(lambda state: calls.append(state['results']['pack']), 'report',
+                           after=['pack'], with_state=True)
+                return s.start()
+
+            with open(src, 'w', encoding='utf-8') as f:
+                f.write('v1')
+            age(src, 60)
+            run()
+            self.assertEqual(calls, ['build', 'pack', 'pkg'])
+            age(out, 30)
+            summary = run()
+            self.assertEqual(calls, ['pkg'])
+            self.assertEqual(summary['up_to_date'], ['build', 'pack'])
+            self.assertEqual(summary['passed'], ['report'])
+            self.assertIn('2 up to date', summary['text'])
+            # touched without changing its content: still up to date
+            age(src, -60)
+            run()
+            self.assertEqual(calls, ['pkg'])
+            # a changed input rebuilds the task and everything downstream of it
+            with open(src, 'w', encoding='utf-8') as f:
+                f.write('v2')
+            age(src, -60)
+            run()
+            self.assertEqual(calls, ['build', 'pack', 'pkg'])
+            with open(pkg, encoding='utf-8') as f:
+                self.assertEqual(f.read(), 'v2')
+
+    def test_start_When_UpToDateWithoutRecordedResult(self, *patches):
+        with tempfile.TemporaryDirectory() as directory:
+            out = os.path.join(directory, 'out')
+            with open(out, 'w', encoding='utf-8') as f:
+                f.write('built')
+            # without a cache_dir no result is recorded, so the task runs to produce one
+            s = Scheduler()
+            s.register(Mock(return_value=1), 'build', outputs=[out])
+            s.register(lambda state: state['results']['build'], 'use', after=['build'],
+                       with_state=True)
+            summary = s.start()
+            self.assertEqual(summary['passed'], ['build', 'use'])
+            self.assertEqual(summary['up_to_date'], [])
+            # a task whose result nothing reads is still skipped on modification times
+            s = Scheduler(store_results=False)
+            s.register(Mock(return_value=1), 'build', outputs=[out])
+            self.assertEqual(s.start()['up_to_date'], ['build'])
+            # with one, a task whose result was never recorded runs to record it
+            s = Scheduler(cache_dir=os.path.join(directory, 'cache'))
+            s.register(Mock(return_value=1), 'build', outputs=[out])
+            self.assertEqual(s.start()['passed'], ['build'])
+            self.assertEqual(s.start()['up_to_date'], ['build'])
+            self.assertEqual(s.state['results']['build'], 1)
+
+    def test_start_When_InputsAndOutputsOffSchedulerThread(self, *patches):
+        from thread_order import uptodate
+        threads = []
+
+        def record(function):
+            def wrapper(*args):
+                threads.append((function.__name__, threading.current_thread().name))
+                return function(*args)
+            return wrapper
+
+        with tempfile.TemporaryDirectory() as directory, \
+                patch('thread_order.scheduler.is_up_to_date', record(uptodate.is_up_to_date)), \
+                patch('thread_order.scheduler.input_digests', record(uptodate.input_digests)):
+            src, out = os.path.join(directory, 'src'), os.path.join(directory, 'out')
+            with open(src, 'w', encoding='utf-8') as f:
+                f.write('v1')
+            for _ in range(2):
+                s = Scheduler(workers=1, cache_dir=os.path.join(directory, 'cache'))
+                s.register(lambda: open(out, 'w').close() or 1, 'build', inputs=[src],
+                           outputs=[out])
+                s.start()
+            self.assertEqual(s.state['results']['build'], 1)
+        # files are hashed by the worker that ran the task and checked on the lookup
+        # thread, never on the scheduler thread
+        self.assertEqual(threads, [
+            ('is_up_to_date', 'lookup_0'), ('input_digests', 'thread_0'),
+            ('is_up_to_date', 'lookup_0')])
+
+    def test_register_ValueError_When_InvalidInputsOrOutputs(self, *patches):
+        s = Scheduler()
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'a', inputs='*.c')
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'a', outputs=[1])
+
+    def test_start_When_JournalFile(self, *patches):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'run.jsonl')
+            s = Scheduler(skip_dependents=True, journal_file=path)
+            s.register(Mock(return_value=[1, 2]), 'a')
+            s.register(Mock(__name__='b', side_effect=ValueError('bad')), 'b', after=['a'])
+            s.register(Mock(), 'c', after=['b'])
+            s.start()
+            statuses, results = read_journal(path)
+        self.assertEqual(statuses, {'a': 'PASSED', 'b': 'FAILED', 'c': 'SKIPPED'})
+        self.assertEqual(results, {'a': [1, 2]})
+
+    def test_start_When_ReleaseResults(self, *patches):
+        seen = {}
+
+        def snapshot(name):
+            def task(state):
+                seen[name] = sorted(state['results'])
+                return name
+            return task
+
+        s = Scheduler(workers=1, release_results=True)
+        s.register(snapshot('a'), 'a', with_state=True)
+        s.register(snapshot('b'), 'b', after=['a'], with_state=True)
+        s.register(snapshot('c'), 'c', after=['a', 'b'], with_state=True)
+        s.register(snapshot('d'), 'd', after=['c'], with_state=True, keep_result=True)
+        s.register(snapshot('e'), 'e', after=['d'], with_state=True)
+        summary = s.start()
+        self.assertEqual(summary['passed'], ['a', 'b', 'c', 'd', 'e'])
+        # a is still needed by c, and c's results are dropped as soon as d has run
+        self.assertEqual(seen['c'], ['a', 'b'])
+        self.assertEqual(seen['e'], ['d'])
+        # leaves and pinned results are kept
+        self.assertEqual(s.state['results'], {'d': 'd', 'e': 'e'})
+
+    def test_start_When_ReleaseResultsAndDependentsSkipped(self, *patches):
+        s = Scheduler(workers=2, release_results=True, skip_dependents=True)
+
+        def slow():
+            time.sleep(0.1)
+            return 'slow'
+
+        s.register(Mock(__name__='bad', side_effect=ValueError('bad')), 'bad')
+        s.register(slow, 'slow')
+        s.register(Mock(), 'after_both', after=['bad', 'slow'])
+        summary = s.start()
+        self.assertEqual(summary['skipped'], ['after_both'])
+        # the only dependent of slow was skipped before slow finished
+        self.assertEqual(s.state['results'], {})
+
+    def test_register_ValueError_When_InvalidKeepResult(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler().register(Mock(), 'a', keep_result='yes')
+
+    def test_start_When_CacheWithoutCacheDir(self, *patches):
+        function = Mock(return_value=1)
+        s = Scheduler()
+        s.register(function, 'a', cache=True)
+        s.start()
+        summary = s.start()
+        self.assertEqual(function.call_count, 2)
+        self.assertEqual(summary['cached'], [])
+
+    def test_register_ValueError_When_InvalidCacheOptions(self, *patches):
+        s = Scheduler()
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'a', cache='yes')
+        with self.assertRaises(ValueError):
+            s.register(Mock(), 'a', cache=True, cache_inputs='key')
+
+    def test_init_ValueError_When_InvalidCacheSize(self, *patches):
+        with self.assertRaises(ValueError):
+            Scheduler(cache_dir='cache', cache_size=0)
+
+    def test_start_When_CriticalPathPolicy(self, *patches):
+        order = []
+        s = Scheduler(workers=1, policy='critical_path')
+        s.register_many({
+            'a': (lambda: order.append('a'), None, False),
+            'z': (lambda: order.append('z'), None, False),
+            'z1': (lambda: order.append('z1'), ['z'], False),
+            'z2': (lambda: order.append('z2'), ['z1'], False),
+        })
+        s.start()
+        # the longer chain starts first despite its name; equal ranks fall back to name order
+        self.assertEqual(order, ['z', 'z1', 'a', 'z2'])
+
+    @patch('thread_order.scheduler.TimingHistory')
+    def test_start_When_CriticalPathPolicyWithHistory(self, history_patch, *patches):
+        order = []
+        history_patch.return_value.weights.return_value = {'a': 10.0, 'z': 1.0, 'z1': 1.0}
+        s = Scheduler(workers=1, policy='critical_path', history_file='history.json')
+        s.register_many({
+            'a': (lambda: order.append('a'), None, False),
+            'z': (lambda: order.append('z'), None, False),
+            'z1': (lambda: order.append('z1'), ['z'], False),
+        })
+        summary = s.start()
+        # 'a' alone takes longer than the whole z chain so it goes first
+        self.assertEqual(order, ['a', 'z', 'z1'])
+        self.assertEqual(set(summary['durations']), {'a', 'z', 'z1'})
+        self.assertEqual(history_patch.return_value.record.call_count, 3)
+        history_patch.return_value.save.assert_called_once()
+
+    @patch('thread_order.scheduler.TimingHistory')
+    def test_start_When_CriticalPathPolicyWithUpdatedHistory(self, history_patch, *patches):
+        order = []
+        history_patch.return_value.weights.return_value = {'a': 10.0, 'z': 1.0, 'z1': 1.0}
+        s = Scheduler(workers=1, policy='critical_path', history_file='history.json')
+        s.register_many({
+            'a': (lambda: order.append('a'), None, False),
+            'z': (lambda: order.append('z'), None, False),
+            'z1': (lambda: order.append('z1'), ['z'], False),
+        })
+        s.start()
+        # the durations recorded by the first run rank the second
+        history_patch.return_value.weights.return_value = {'a': 1.0, 'z': 5.0, 'z1': 5.0}
+        order.clear()
+        s.start()
+        self.assertEqual(order, ['z', 'z1', 'a'])
+
+    @patch('thread_order.scheduler.TimingHistory')
+    def test_save_history_When_OSError(self, history_patch, *patches):
+        history_patch.return_value.save.side_effect = OSError('read-only')
+        s = Scheduler(history_file='history.json')
+        logger_mock = Mock()
+        s._save_history(logger_mock)
+        logger_mock.warning.assert_called_once_with('unable to save timing history: read-only')
+
+    def test_start_When_CalledRepeatedly(self, *patches):
+        calls = []
+        s = Scheduler(workers=2)
+        s.register_many({
+            'a': (lambda: calls.append('a'), None, False),
+            'b': (lambda: calls.append('b'), ['a'], False),
+        })
+        first = s.start()
+        plan = s.plan
+        second = s.start()
+        self.assertEqual(calls, ['a', 'b', 'a', 'b'])
+        self.assertEqual(first['passed'], ['a', 'b'])
+        self.assertEqual(second['passed'], ['a', 'b'])
+        # the compiled plan is reused and the graph is left intact
+        self.assertIs(s.plan, plan)
+        self.assertEqual(set(s.graph.nodes()), {'a', 'b'})
+
+    def test_plan_When_TaskRegisteredAfterStart(self, *patches):
+        s = Scheduler(workers=2)
+        s.register(lambda: None, 'a')
+        s.start()
+        plan = s.plan
+        s.register(lambda: None, 'b', after=['a'])
+        self.assertIsNot(s.plan, plan)
+        self.assertEqual(s.start()['passed'], ['a', 'b'])
+
+    def test_start_When_ReduceEdges(self, *patches):
+        s = Scheduler(workers=2, reduce_edges=True, skip_dependents=True)
+        s.register_many({
+            'a': (Mock(__name__='a', side_effect=Exception('error')), None, False),
+            'b': (Mock(), ['a'], False),
+            'c': (Mock(), ['a', 'b'], False),
+        })
+        summary = s.start()
+        self.assertEqual(s.plan.parents_of('c'), ('b',))
+        self.assertEqual(s.plan.original_parents_of('c'), ('a', 'b'))
+        self.assertEqual(summary['failed'], ['a'])
+        self.assertEqual(summary['skipped'], ['b', 'c'])
+
     def test_register_ValueError(self, *patches):
         s = Scheduler(workers=2)
         with self.assertRaises(ValueError):
@@ -31,6 +934,21 @@ class TestScheduler(unittest.TestCase):
         self.assertIn('task1', s._callables)
         self.assertIn('task1', s.graph.nodes())
 
+    def test_register_many(self, *patches):
+        s = Scheduler(workers=2)
+        task1 = Mock()
+        task2 = Mock()
+        s.register_many({'task2': (task2, ['task1'], True), 'task1': (task1, None, False)})
+        self.assertEqual(s._callables, {'task1': (task1, False), 'task2': (task2, True)})
+        self.assertEqual(s.graph.parents_of('task2'), ['task1'])
+
+    def test_register_many_ValueError(self, *patches):
+        s = Scheduler(workers=2)
+        with self.assertRaises(ValueError) as error:
+            s.register_many({'task1': ('not_callable', None, False), 'task2': (Mock(), None, False)})
+        self.assertEqual(str(error.exception), "objects must be callable: ['task1']")
+        self.assertEqual(s._callables, {})
+
     @patch('thread_order.scheduler.Scheduler.register')
     def test_dregister_with_state(self, register_patch, *patches):
         mock_function = Mock(__name__='mock_function')
@@ -60,41 +978,69 @@ class TestScheduler(unittest.TestCase):
     @patch('thread_order.scheduler.Scheduler._submit')
     def test_maybe_schedule_next_NoFree(self, submit_patch, *patches):
         s = Scheduler(workers=1)
-        s._active.add('task')
+        s.register(Mock(), 'task')
+        s.register(Mock(), 'other')
+        s._prep_start()
+        s._capacity.claim({('executor', 'thread'): 1})
         s._maybe_schedule_next(Mock())
-        self.assertEqual(len(s._active), 1)
         submit_patch.assert_not_called()
 
     @patch('thread_order.scheduler.Scheduler._submit')
     def test_maybe_schedule_next_When_NoSkip(self, submit_patch, *patches):
         s = Scheduler(workers=2)
-        graph_mock = Mock()
-        graph_mock.get_candidates.return_value = ['task1', 'task2']
-        s._graph = graph_mock
+        cursor_mock = Mock()
+        cursor_mock.get_candidates.return_value = ['task1', 'task2']
+        s._cursor = cursor_mock
         s._maybe_schedule_next(Mock())
         submit_patch.assert_has_calls([call('task1'), call('task2')])
 
-    @patch('thread_order.scheduler.Scheduler._submit')
-    def test_maybe_schedule_next_WhenSkip(self, submit_patch,*patches):
+    @patch('thread_order.scheduler.Scheduler._maybe_schedule_next')
+    def test_handle_done_When_SkipDependents(self, *patches):
         s = Scheduler(workers=2, skip_dependents=True)
-        s._failed.append('task1')
-        graph_mock = Mock()
-        graph_mock.get_candidates.return_value = ['task3', 'task4']
-        # original parent of task3 and task4 are task1 and task2 respectively
-        # task1 failed, so task3 should be skipped
-        # task4 should be scheduled
-        graph_mock.original_parents_of.side_effect = [['task1'], ['task2']]
-        s._graph = graph_mock
-        s._maybe_schedule_next(Mock())
-        s._submit.assert_has_calls([call('task4')])
+        s.register_many({
+            'a': (Mock(), None, False),
+            'b': (Mock(), None, False),
+            'c': (Mock(), ['a'], False),
+            'd': (Mock(), ['c', 'b'], False),
+            'e': (Mock(), ['d'], False),
+        })
+        done = []
+        s.on_task_done(lambda *args: done.append(args))
+        s._prep_start()
+        s._cursor.get_candidates(set())
+        s._handle_done(('a', 'thread_0', False, 'ValueError', 'error'), Mock())
+        # every dependent is skipped at once, without waiting for b or going through the queue
+        self.assertEqual(done, [
+            ('a', 'thread_0', TaskStatus.FAILED, 1),
+            ('c', '', TaskStatus.SKIPPED, 2),
+            ('d', '', TaskStatus.SKIPPED, 3),
+            ('e', '', TaskStatus.SKIPPED, 4),
+        ])
+        self.assertTrue(s._events.empty())
+        self.assertEqual(s._skipped, ['c', 'd', 'e'])
+        self.assertEqual(s._ran, ['a', 'c', 'd', 'e'])
+        self.assertEqual(s._results['d']['error_type'], 'DependencyError')
+        self.assertEqual(s._results['d']['error'], "skipped due to failed dependency: {'c'}")
+        s._handle_done(('b', 'thread_1', True, '', ''), Mock())
+        self.assertTrue(s._cursor.is_empty())
+        self.assertTrue(s._completed.is_set())
+
+    def test_start_When_SkipDependentsOfLongChain(self, *patches):
+        s = Scheduler(workers=2, skip_dependents=True)
+        s.register(Mock(__name__='root', side_effect=Exception('error')), 'root')
+        for i in range(2000):
+            s.register(Mock(), f'n{i}', after=['root' if i == 0 else f'n{i - 1}'])
+        summary = s.start()
+        self.assertEqual(summary['failed'], ['root'])
+        self.assertEqual(summary['skipped'], [f'n{i}' for i in range(2000)])
 
     @patch('thread_order.scheduler.Scheduler._maybe_schedule_next')
     @patch('thread_order.scheduler.Scheduler._callback')
     def test_handle_done_When_Ok(self, callback_patch, *patches):
         s = Scheduler()
-        graph_mock = Mock()
-        graph_mock.is_empty.return_value = False
-        s._graph = graph_mock
+        cursor_mock = Mock()
+        cursor_mock.is_empty.return_value = False
+        s._cursor = cursor_mock
         function_mock = Mock()
         s.on_task_done(function_mock)
         mock_payload = ('task1', 'thread_0', True, '', '')
@@ -106,9 +1052,9 @@ class TestScheduler(unittest.TestCase):
     @patch('thread_order.scheduler.Scheduler._callback')
     def test_handle_done_When_NotOk(self, callback_patch, *patches):
         s = Scheduler()
-        graph_mock = Mock()
-        graph_mock.is_empty.return_value = True
-        s._graph = graph_mock
+        cursor_mock = Mock()
+        cursor_mock.is_empty.return_value = True
+        s._cursor = cursor_mock
         function_mock = Mock()
         s.on_task_done(function_mock)
         mock_payload = ('task1', 'thread_0', False, 'ValueError', 'ValueError')
@@ -121,9 +1067,9 @@ class TestScheduler(unittest.TestCase):
     @patch('thread_order.scheduler.Scheduler._callback')
     def test_handle_done_When_NotOkDependencyError(self, callback_patch, *patches):
         s = Scheduler()
-        graph_mock = Mock()
-        graph_mock.is_empty.return_value = True
-        s._graph = graph_mock
+        cursor_mock = Mock()
+        cursor_mock.is_empty.return_value = True
+        s._cursor = cursor_mock
         function_mock = Mock()
         s.on_task_done(function_mock)
         mock_payload = ('task1', 'thread_0', False, 'DependencyError', 'DependencyError')
@@ -138,7 +1084,7 @@ class TestScheduler(unittest.TestCase):
         function_mock = Mock()
         s.on_task_start(function_mock)
         with patch.object(s, '_events') as events_patch:
-            events_patch.get_nowait.side_effect = [('start', 'task1'), queue.Empty()]
+            events_patch.get.side_effect = [('start', 'task1'), queue.Empty()]
             s._handle_event()
             callback_patch.assert_called_once_with((function_mock, (), {}), 'task1')
 
@@ -148,10 +1094,23 @@ class TestScheduler(unittest.TestCase):
         function_mock = Mock()
         s.on_task_run(function_mock)
         with patch.object(s, '_events') as events_patch:
-            events_patch.get_nowait.side_effect = [('run', ('task1', 'thread1')), queue.Empty()]
+            events_patch.get.side_effect = [('run', ('task1', 'thread1')), queue.Empty()]
             s._handle_event()
             callback_patch.assert_called_once_with((function_mock, (), {}), 'task1', 'thread1')
 
+    @patch('thread_order.scheduler.Scheduler._callback')
+    def test_handle_event_When_Block(self, callback_patch, *patches):
+        s = Scheduler()
+        with patch.object(s, '_events') as events_patch:
+            events_patch.get.side_effect = [('start', 'task1'), ('start', 'task2'), queue.Empty()]
+            s._handle_event(block=True, timeout=1.0)
+            # only the first read blocks; the rest of the queue is drained without waiting
+            events_patch.get.assert_has_calls([
+                call(block=True, timeout=1.0),
+                call(block=False, timeout=1.0),
+                call(block=False, timeout=1.0)])
+            self.assertEqual(callback_patch.call_count, 2)
+
     @patch('thread_order.scheduler.logging.getLogger')
     @patch('thread_order.scheduler.Scheduler._handle_done')
     def test_handle_event_When_Done(self, handle_done_patch, get_logger_patch, *patches):
@@ -159,7 +1118,7 @@ class TestScheduler(unittest.TestCase):
         function_mock = Mock()
         s.on_task_done(function_mock)
         with patch.object(s, '_events') as events_patch:
-            events_patch.get_nowait.side_effect = [('done', ('task1', True, '', '')), queue.Empty()]
+            events_patch.get.side_effect = [('done', ('task1', True, '', '')), queue.Empty()]
             s._handle_event()
             handle_done_patch.assert_called_once_with(('task1', True, '', ''), get_logger_patch.return_value)
 
@@ -169,6 +1128,7 @@ class TestScheduler(unittest.TestCase):
 
     def test_handle_interrupt(self, *patches):
         s = Scheduler()
+        s._cursor = Mock()
         s._active.add('task1')
         with patch.object(s, '_futures') as futures_patch:
             fmock1 = Mock()
@@ -179,6 +1139,7 @@ class TestScheduler(unittest.TestCase):
             fmock1.cancel.assert_called_once()
             fmock2.cancel.assert_called_once()
             self.assertEqual(s._results['task1'], {'ok': False, 'error_type': 'CancelledError', 'error': 'cancelled'})
+            s._cursor.remove.assert_called_once_with('task1')
 
     def test_prep_start(self, *patches):
         s = Scheduler()
@@ -199,15 +1160,15 @@ class TestScheduler(unittest.TestCase):
         scheduler_done_mock = Mock()
         s.on_scheduler_start(scheduler_start_mock)
         s.on_scheduler_done(scheduler_done_mock)
-        graph_mock = Mock()
-        graph_mock.get_candidates.return_value = ['task1', 'task2']
-        s._graph = graph_mock
+        cursor_mock = Mock()
+        cursor_mock.get_candidates.return_value = ['task1', 'task2']
+        s._cursor = cursor_mock
         with patch.object(s, '_completed') as completed_patch:
-            completed_patch.wait.side_effect = [False, False, False, True]
+            completed_patch.is_set.side_effect = [False, False, False, True]
             s.start()
         prep_start_patch.assert_called_once()
         submit_patch.assert_has_calls([call('task1'), call('task2')])
-        handle_event_patch.assert_called()
+        handle_event_patch.assert_any_call(block=True, timeout=IDLE_WAKEUP)
         build_summary_patch.assert_called_once()
         callback_patch.assert_called()
 
@@ -219,20 +1180,21 @@ class TestScheduler(unittest.TestCase):
     @patch('thread_order.scheduler.Scheduler._callback')
     def test_start_When_KeyboardInterrupt(self, callback_patch, prep_start_patch, submit_patch, handle_event_patch, build_summary_patch, *patches):
         s = Scheduler()
-        graph_mock = Mock()
-        graph_mock.get_candidates.return_value = ['task1', 'task2']
-        s._graph = graph_mock
+        cursor_mock = Mock()
+        cursor_mock.get_candidates.return_value = ['task1', 'task2']
+        s._cursor = cursor_mock
         with patch.object(s, '_completed') as completed_patch:
-            completed_patch.wait.side_effect = [False, False, False, KeyboardInterrupt]
+            completed_patch.is_set.side_effect = [False, False, False, KeyboardInterrupt]
             result = s.start()
         self.assertEqual(result, build_summary_patch.return_value)
 
     def test_submit(self, *patches):
         s = Scheduler()
-        with patch.object(s, '_events') as events_patch, \
-            patch.object(s, '_executor') as executor_patch:
+        executor_mock = Mock()
+        s._executors = {'thread': executor_mock}
+        with patch.object(s, '_events') as events_patch:
             future_mock = Mock()
-            executor_patch.submit.return_value = future_mock
+            executor_mock.submit.return_value = future_mock
             s._submit('task1')
             events_patch.put.assert_called_once_with(('start', 'task1'))
             self.assertEqual(s._futures[future_mock], 'task1')
@@ -255,7 +1217,7 @@ class TestScheduler(unittest.TestCase):
             future_mock = Mock()
             future_mock.result.side_effect = Exception('error')
             s._done(future_mock)
-            events_patch.put.assert_called_once_with(('done', ('task1', False, 'Exception', 'error')))
+            events_patch.put.assert_called_once_with(('done', ('task1', '', False, 'Exception', 'error')))
 
     def test_run_When_WithState(self, *patches):
         s = Scheduler(store_results=True)
@@ -370,8 +1332,13 @@ class TestScheduler(unittest.TestCase):
         path_mock.exists.return_value = True
         path_patch.return_value = path_mock
         spec_mock = Mock()
+        spec_mock.name = 'loaded_module'
         util_patch.spec_from_file_location.return_value = spec_mock
-        result = _load_module('module')
+        try:
+            result = _load_module('module')
+            self.assertIs(sys.modules['loaded_module'], result)
+        finally:
+            sys.modules.pop('loaded_module', None)
         self.assertEqual(result, util_patch.module_from_spec.return_value)
 
     @patch('thread_order.scheduler._load_module')
@@ -408,3 +1375,84 @@ class TestScheduler(unittest.TestCase):
         self.assertEqual(result[0], load_module_patch.return_value)
         self.assertEqual(result[1], [('fn_a', function_mock, False)])
         self.assertEqual(result[2], True)
+
+    @patch('thread_order.scheduler._load_module')
+    @patch('thread_order.scheduler._collect_functions')
+    def test_load_and_collect_functions_with_upstream(self, collect_functions_patch, load_module_patch, *patches):
+        functions = [
+            ('fn_a', Mock(), {'after': []}),
+            ('fn_b', Mock(), {'after': ['fn_a']}),
+            ('fn_c', Mock(), {'after': ['fn_b', 'fn_x']}),
+            ('fn_d', Mock(), {'after': ['fn_a']}),
+            ('fn_e', Mock(), {'after': ['fn_c']}),
+        ]
+        collect_functions_patch.return_value = functions
+        result = load_and_collect_functions('target_module::fn_c', with_upstream=True)
+        self.assertEqual(result[1], functions[:3])
+        self.assertEqual(result[2], False)
+
+    def test_mark_When_Options(self, *patches):
+        wrapped = mark(executor='process')(Mock(__name__='task'))
+        self.assertEqual(wrapped.__thread_order__['executor'], 'process')
+        self.assertNotIn('executor', mark(executor=None)(Mock(__name__='task')).__thread_order__)
+        with self.assertRaises(ValueError):
+            dmark(executor='fiber')
+
+    def test_mark_When_Coroutine(self, *patches):
+        async def task(state):
+            return state['value']
+
+        wrapped = mark()(task)
+        self.assertTrue(inspect.iscoroutinefunction(wrapped))
+        self.assertEqual(asyncio.run(wrapped({'value': 1})), 1)
+        self.assertEqual(wrapped.__thread_order__['orig_name'], 'task')
+
+    @patch('thread_order.scheduler._get_functions')
+    def test_collect_functions_When_Async(self, get_functions_patch, *patches):
+        async def fn_a():
+            pass
+        fn_a = mark()(fn_a)
+        get_functions_patch.return_value = [('fn_a', fn_a, True)]
+        result = _collect_functions(Mock(fn_a=fn_a), 'module.py')
+        self.assertEqual(result, [('fn_a', fn_a, fn_a.__thread_order__)])
+
+    @patch('thread_order.scheduler._get_functions')
+    def test_collect_functions_When_Cache(self, get_functions_patch, *patches):
+        fn_a = mark(tags='t1')(Mock(__name__='fn_a'))
+        fn_b = mark(after=['fn_a'])(Mock(__name__='fn_b'))
+        module = Mock(fn_a=fn_a, fn_b=fn_b)
+        get_functions_patch.return_value = [('fn_a', fn_a, False), ('fn_b', fn_b, False), ('fn_c', Mock(spec=[]), False)]
+        cache = Mock()
+        cache.load.return_value = None
+        result = _collect_functions(module, 'module.py', tags_filter=['t1'], cache=cache)
+        self.assertEqual(result, [('fn_a', fn_a, fn_a.__thread_order__)])
+        entries = cache.save.call_args[0][1]
+        self.assertEqual([e['name'] for e in entries], ['fn_a', 'fn_b'])
+        self.assertEqual(entries[1], {'name': 'fn_b', 'after': ['fn_a'], 'with_state': True, 'tags': [], 'is_async': False})
+        # unchanged module: names come from the cache, the source is not walked again
+        get_functions_patch.reset_mock()
+        cache.reset_mock()
+        cache.load.return_value = entries
+        result = _collect_functions(module, 'module.py', cache=cache)
+        self.assertEqual([name for name, _, _ in result], ['fn_a', 'fn_b'])
+        get_functions_patch.assert_not_called()
+        cache.save.assert_not_called()
+
+    @patch('thread_order.scheduler._load_module')
+    def test_load_and_collect_functions_graph_only(self, load_module_patch, *patches):
+        cache = Mock()
+        cache.load.return_value = [
+            {'name': 'fn_a', 'after': [], 'with_state': True, 'tags': ['t1'], 'is_async': False},
+            {'name': 'fn_b', 'after': ['fn_a'], 'with_state': True, 'tags': [], 'is_async': False}]
+        module, functions, single_function_mode = load_and_collect_functions(
+            'module.py', ['t1'], cache=cache, graph_only=True)
+        load_module_patch.assert_not_called()
+        self.assertIsNone(module)
+        self.assertEqual([(name, function) for name, function, _ in functions], [('fn_a', None)])
+
+    def test_build_graph(self, *patches):
+        functions = [('fn_a', None, {'after': []}), ('fn_b', None, {'after': ['fn_a', 'fn_x']})]
+        graph = build_graph(functions, ['t1'], False)
+        self.assertEqual(graph.parents_of('fn_b'), ['fn_a'])
+        graph = build_graph(functions[1:], None, True)
+        self.assertEqual(graph.parents_of('fn_b'), [])
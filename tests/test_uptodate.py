@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from thread_order.uptodate import FileStats, BuildRecords, input_digests, is_up_to_date
+
+class TestUpToDate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = self.path('src.txt')
+        self.out = self.path('out.txt')
+        self.write(self.src, 'source', age=20)
+        self.write(self.out, 'built', age=10)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write(self, path, text, age=0):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        self.touch(path, age)
+
+    def touch(self, path, age=0):
+        mtime = os.stat(path).st_mtime - age
+        os.utime(path, (mtime, mtime))
+
+    def test_expand(self):
+        stats = FileStats()
+        self.assertEqual(stats.expand([self.path('*.txt')]), [self.out, self.src])
+        self.assertEqual(stats.expand([self.path('*.md')]), [])
+        self.assertIsNone(stats.expand([self.path('missing.txt')]))
+
+    def test_stat_When_Cached(self):
+        stats = FileStats()
+        before = stats.stat(self.src)
+        self.write(self.src, 'changed source')
+        self.assertEqual(stats.stat(self.src), before)
+        stats.forget([self.src])
+        self.assertNotEqual(stats.stat(self.src), before)
+
+    def test_is_up_to_date(self):
+        self.assertTrue(is_up_to_date([self.src], [self.out], FileStats()))
+        self.assertTrue(is_up_to_date([], [self.out], FileStats()))
+
+    def test_is_up_to_date_When_OutputMissingOrNotDeclared(self):
+        self.assertFalse(is_up_to_date([self.src], [self.path('missing.txt')], FileStats()))
+        self.assertFalse(is_up_to_date([self.src], [], FileStats()))
+
+    def test_is_up_to_date_When_InputMissing(self):
+        self.assertFalse(is_up_to_date([self.path('missing.txt')], [self.out], FileStats()))
+
+    def test_is_up_to_date_When_InputNewer(self):
+        recorded = input_digests([self.src], FileStats())
+        self.touch(self.src, age=-20)
+        self.assertFalse(is_up_to_date([self.src], [self.out], FileStats()))
+        # touched but unchanged since the outputs were built
+        self.assertTrue(is_up_to_date([self.src], [self.out], FileStats(), recorded))
+        self.write(self.src, 'changed source', age=-20)
+        self.assertFalse(is_up_to_date([self.src], [self.out], FileStats(), recorded))
+
+    def test_build_records(self):
+        records = BuildRecords(self.path('cache'))
+        self.assertIsNone(records.load('module.py::build'))
+        records.save('module.py::build', {self.src: 'digest'})
+        self.assertEqual(
+            BuildRecords(self.path('cache')).load('module.py::build'),
+            {'inputs': {self.src: 'digest'}})
+
+    def test_build_records_When_Result(self):
+        records = BuildRecords(self.path('cache'))
+        records.save('a', {}, {'size': 3}, True)
+        records.save('b', {}, None, True)
+        # a result that cannot be stored as JSON is left out
+        records.save('c', {}, object(), True)
+        self.assertEqual(records.load('a'), {'inputs': {}, 'result': {'size': 3}})
+        self.assertEqual(records.load('b'), {'inputs': {}, 'result': None})
+        self.assertEqual(records.load('c'), {'inputs': {}})
@@ -10,6 +10,8 @@ __all__ = [
     'dmark',
     'mark',
     'default_workers',
+    'POLICIES',
+    'EXECUTORS',
     'load_and_collect_functions',
     'register_functions',
     'validate_highlights',
@@ -37,6 +39,12 @@ def __getattr__(name):
     if name == 'default_workers':
         from .scheduler import default_workers
         return default_workers
+    if name == 'POLICIES':
+        from .scheduler import POLICIES
+        return POLICIES
+    if name == 'EXECUTORS':
+        from .scheduler import EXECUTORS
+        return EXECUTORS
     if name == 'load_and_collect_functions':
         from .scheduler import load_and_collect_functions
         return load_and_collect_functions
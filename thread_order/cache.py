@@ -0,0 +1,216 @@
+"""
+On-disk caches for thread_order.
+
+The discovery cache remembers which functions of a module are marked with
+@mark and their metadata, keyed by a hash of the module's content, so tdrun
+does not have to parse and walk the module source again until it changes.
+
+The result cache stores the return values of tasks marked with cache=True,
+content-addressed by a key derived from everything the result depends on,
+so an unchanged task is not run again on the next run.
+"""
+import os
+import json
+import pickle
+import inspect
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = '.thread_order'
+# bytes the result cache may take up before the least recently used results are evicted
+DEFAULT_RESULT_CACHE_SIZE = 1 << 30
+
+def file_digest(path):
+    """ return the sha256 hex digest of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def module_key(module_path):
+    """ return the name under which per-module files are kept: the sha256 hex digest of
+        the module's absolute path
+    """
+    return hashlib.sha256(os.path.abspath(module_path).encode('utf-8')).hexdigest()
+
+def function_digest(function):
+    """ return the sha256 hex digest of a function's source and of the values it closes
+        over and takes as defaults, so closures built by one factory get different
+        digests; None when the source cannot be retrieved or those values pickled
+    """
+    function = inspect.unwrap(function)
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        return None
+    try:
+        cells = [cell.cell_contents for cell in function.__closure__ or ()]
+    except ValueError:
+        # a cell that is not filled in yet
+        return None
+    bindings = value_digest(
+        (cells, getattr(function, '__defaults__', None), getattr(function, '__kwdefaults__', None)))
+    if bindings is None:
+        return None
+    return hashlib.sha256(f'{source}\0{bindings}'.encode('utf-8')).hexdigest()
+
+def value_digest(value):
+    """ return the sha256 hex digest of a value's pickle, or None when it cannot be pickled
+    """
+    try:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+def result_key(parts):
+    """ return the cache key of a result from the JSON-serializable parts it depends on
+    """
+    data = json.dumps(parts, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+def _write_json(path, data):
+    """ write data as JSON to path, replacing the file atomically
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.name}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+class DiscoveryCache:
+    """ @mark metadata discovered in a module, one entry per module path
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self._directory = Path(directory) / 'discovery'
+        # module path → content digest, so a module is hashed once per run
+        self._digests = {}
+
+    def _entry_path(self, module_path):
+        return self._directory / f'{module_key(module_path)}.json'
+
+    def _digest(self, module_path):
+        key = os.path.abspath(module_path)
+        if key not in self._digests:
+            from . import __version__
+            self._digests[key] = f'{__version__}:{file_digest(module_path)}'
+        return self._digests[key]
+
+    def load(self, module_path):
+        """ return the cached entries for module_path, or None when there are none or
+            the module changed since they were saved
+        """
+        try:
+            with open(self._entry_path(module_path), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('digest') != self._digest(module_path):
+                return None
+            return data['functions']
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+
+    def save(self, module_path, functions):
+        """ store entries for module_path; functions is a list of JSON-serializable dicts
+        """
+        data = {'digest': self._digest(module_path), 'functions': functions}
+        try:
+            _write_json(self._entry_path(module_path), data)
+        except (OSError, TypeError, ValueError):
+            # caching is best effort; a read-only directory or odd metadata just means
+            # the module is walked again next time
+            pass
+
+class ResultCache:
+    """ task results stored by key, evicting the least recently used ones beyond max_size
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_size=DEFAULT_RESULT_CACHE_SIZE):
+        self._directory = Path(directory) / 'results'
+        self._max_size = max_size
+        # bytes taken up by stored results; scanned on first save
+        self._size = None
+        # workers save results at the same time; guards replacing entries, _size and eviction
+        self._lock = threading.Lock()
+
+    def _entry_path(self, key):
+        return self._directory / key[:2] / f'{key}.pickle'
+
+    def load(self, key):
+        """ return the result stored under key; raise KeyError when there is none or it
+            cannot be read
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            # the modification time orders entries for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+        except Exception as exception:
+            raise KeyError(key) from exception
+        return value
+
+    def save(self, key, value):
+        """ store value under key and evict old results beyond max_size; return False
+            when value cannot be pickled or written
+
+            safe to call from several threads at once: each call writes a temporary file
+            of its own, and only moving it in place and the size accounting are serialized
+        """
+        path = self._entry_path(key)
+        tmp_path = None
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(data) > self._max_size:
+                return False
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'{key}.', suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            with self._lock:
+                previous = path.stat().st_size if path.exists() else 0
+                os.replace(tmp_path, path)
+                tmp_path = None
+                if self._size is None:
+                    self._size = sum(size for _, size, _ in self._entries())
+                else:
+                    self._size += len(data) - previous
+                if self._size > self._max_size:
+                    self._evict(keep=path)
+        except Exception:
+            # caching is best effort, like the discovery cache
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+            return False
+        return True
+
+    def _entries(self):
+        """ yield (modification time, size, path) of every stored result
+        """
+        for path in self._directory.glob('*/*.pickle'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            yield stat.st_mtime, stat.st_size, path
+
+    def _evict(self, keep):
+        """ delete the least recently used results until the cache fits in max_size;
+            called with the lock held
+        """
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self._max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._size -= size
@@ -0,0 +1,51 @@
+"""
+Capacity accounting for thread_order.
+
+The Scheduler only dispatches a ready task once every unit it needs is free,
+such as a worker slot of the executor it runs on. Tasks that do not fit are
+parked on the PlanCursor until units come back.
+"""
+class Capacity:
+    """ named counters of limited units such as the worker slots of each executor
+
+        A demand maps keys to the number of units a task holds while it runs; it is
+        claimed all at once or not at all.
+    """
+    def __init__(self, limits):
+        self._limits = dict(limits)
+        self._used = dict.fromkeys(self._limits, 0)
+
+    def blocker(self, demand):
+        """ return the first key without enough free units for demand, or None
+        """
+        for key, amount in demand.items():
+            if self._used[key] + amount > self._limits[key]:
+                return key
+        return None
+
+    def claim(self, demand):
+        """ take the units of demand if all are free; return None on success, otherwise
+            the key that is short
+        """
+        key = self.blocker(demand)
+        if key is None:
+            for key, amount in demand.items():
+                self._used[key] += amount
+            return None
+        return key
+
+    def release(self, demand):
+        """ give back the units of a previously claimed demand
+        """
+        for key, amount in demand.items():
+            self._used[key] -= amount
+
+    def limit(self, key):
+        """ return the total number of units under key
+        """
+        return self._limits[key]
+
+    def used(self, key):
+        """ return the number of units under key currently claimed
+        """
+        return self._used[key]
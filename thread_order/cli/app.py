@@ -4,13 +4,19 @@ import json
 from contextlib import nullcontext
 from pathlib import Path
 from thread_order import (
+    EXECUTORS,
+    POLICIES,
     Scheduler,
     ThreadProxyLogger,
     default_workers,
     load_and_collect_functions,
     register_functions,
     validate_highlights)
+from thread_order.cache import DEFAULT_CACHE_DIR, DiscoveryCache
 from thread_order.graph_summary import format_graph_summary
+from thread_order.journal import journal_path, read_journal
+from thread_order.record import RunRecord, select_rerun
+from thread_order.scheduler import _split_target, build_graph, default_async_workers
 try:
     from progress1bar import ProgressBar
     HAS_PROGRESS_BAR = True
@@ -23,6 +29,74 @@ except ImportError:
     HAS_VIEWER = False
 
 logger = ThreadProxyLogger()
+# longest debug dump of the final state, in characters
+STATE_DUMP_LIMIT = 64 * 1024
+
+class _StateDump:
+    """ the final scheduler state as JSON for the debug log; rendered only when a handler
+        actually emits the record, once, and cut off after limit characters
+    """
+    def __init__(self, scheduler, limit=STATE_DUMP_LIMIT):
+        self._scheduler = scheduler
+        self._limit = limit
+        self._text = None
+
+    def __str__(self):
+        if self._text is None:
+            encoder = json.JSONEncoder(indent=2, default=str)
+            chunks = []
+            size = 0
+            # with indent the encoder yields small chunks as it goes, so a large state is
+            # never serialized past the limit
+            for chunk in encoder.iterencode(self._scheduler.sanitized_state):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self._limit:
+                    break
+            text = ''.join(chunks)
+            if size > self._limit:
+                text = f'{text[:self._limit]}... (truncated at {self._limit} characters)'
+            self._text = text
+        return self._text
+
+def _parse_counts(value):
+    """ parse name=count pairs, e.g. 'db=1,gpu_license=2', into a dict
+    """
+    counts = {}
+    for item in value.split(','):
+        name, _, count = item.partition('=')
+        name = name.strip()
+        try:
+            counts[name] = int(count)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid count {count!r} for {name!r}')
+    return counts
+
+def _parse_workers(value):
+    """ parse --workers as a count for the default executor or as
+        executor=count pairs, e.g. 'thread=16,process=4'
+    """
+    if '=' not in value:
+        return int(value)
+    workers = _parse_counts(value)
+    for kind in workers:
+        if kind not in EXECUTORS:
+            raise argparse.ArgumentTypeError(
+                f'unknown executor {kind!r}; executors are {", ".join(EXECUTORS)}')
+    return workers
+
+def _parse_size(value):
+    """ parse a size in bytes with an optional K, M or G suffix, e.g. '500M'
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    text = value.strip().upper()
+    factor = units.get(text[-1:], 1)
+    if factor > 1:
+        text = text[:-1]
+    try:
+        return int(float(text) * factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid size {value!r}')
 
 def get_parser():
     """ return argument parser
@@ -35,10 +109,30 @@ def get_parser():
         help='Python file containing @mark functions')
     parser.add_argument(
         '--workers',
-        type=int,
+        type=_parse_workers,
         default=None,
-        help='Number of worker threads '
+        help='Number of worker threads or processes, or of concurrent coroutines with '
+             '--executor async; or per-executor counts such as thread=16,process=4 '
              '(default: Scheduler default or number of tasks whichever is less)')
+    parser.add_argument(
+        '--executor',
+        choices=EXECUTORS,
+        default='thread',
+        help='run functions on a thread pool, a process pool, or as coroutines on one '
+             'event loop, unless a function chooses its own with @mark(executor=...) '
+             '(default: thread)')
+    parser.add_argument(
+        '--resources',
+        type=_parse_counts,
+        default=None,
+        help='Capacity of each resource class functions claim with @mark(resources=...), '
+             'e.g. db=1,gpu_license=2')
+    parser.add_argument(
+        '--task-timeout',
+        type=float,
+        default=None,
+        help='Seconds a function may run before it is failed with a TimeoutError, '
+             'unless it sets its own with @mark(timeout=...)')
     parser.add_argument(
         '--tags',
         type=str,
@@ -56,10 +150,55 @@ def get_parser():
         '--graph',
         action='store_true',
         help='show dependency graph and exit')
+    parser.add_argument(
+        '--with-upstream',
+        action='store_true',
+        help='when targeting module.py::name also run the functions name depends on')
+    parser.add_argument(
+        '--last-failed',
+        action='store_true',
+        help='run only the functions that failed, were skipped or did not run last time, '
+             'and the functions they depend on whose results were not recorded')
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='continue a run that was killed part way from its journal: run only the '
+             'functions that had not finished successfully')
     parser.add_argument(
         '--skip-deps',
         action='store_true',
         help='skip functions whose dependencies failed')
+    parser.add_argument(
+        '--fail-fast',
+        action='store_true',
+        help='stop dispatching functions after the first failure (same as --max-failures 1)')
+    parser.add_argument(
+        '--max-failures',
+        type=int,
+        default=None,
+        help='stop dispatching functions once this many have failed; running functions can '
+             "exit early by polling state['_cancel']")
+    parser.add_argument(
+        '--policy',
+        choices=POLICIES,
+        default='alphabetical',
+        help='order in which ready functions are dispatched when workers are scarce '
+             '(default: alphabetical)')
+    parser.add_argument(
+        '--history-file',
+        type=str,
+        default=None,
+        help='Path to a file where function durations are recorded; '
+             'the critical_path policy weights functions by their recorded durations')
+    parser.add_argument(
+        '--reduce-edges',
+        action='store_true',
+        help='schedule on the transitive reduction of the declared dependencies')
+    parser.add_argument(
+        '--release-results',
+        action='store_true',
+        help='drop the result of a function from the state once every function that depends '
+             'on it is done, unless it is marked with keep_result=True')
     parser.add_argument(
         '--progress',
         action='store_true',
@@ -68,6 +207,23 @@ def get_parser():
         '--viewer',
         action='store_true',
         help='show thread viewer visualizer (requires thread-viewer package)')
+    parser.add_argument(
+        '--cache-dir',
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+        help=f'Directory for cached module discovery and function results '
+             f'(default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='always discover @mark functions from the module source and run every function, '
+             'even those marked with cache=True')
+    parser.add_argument(
+        '--cache-size',
+        type=_parse_size,
+        default=None,
+        help='Size the cached function results may take up before the least recently used '
+             'are evicted, e.g. 500M or 2G (default: 1G)')
     parser.add_argument(
         '--state-file',
         type=str,
@@ -139,8 +295,11 @@ def _setup_output(scheduler, args):
         def on_task_done(task_name, thread_name, status, count, viewer, *args):
             viewer.done(thread_name)
 
+        thread_count = args.effective_workers
+        if isinstance(thread_count, dict):
+            thread_count = thread_count[args.executor]
         viewer = ThreadViewer(
-            thread_count=args.effective_workers,
+            thread_count=thread_count,
             task_count=total,
             thread_prefix='thread_',
             inactive_char='░')
@@ -179,7 +338,17 @@ def _build_scheduler_kwargs(args, initial_state, clear_results_on_start, module)
         'workers': args.effective_workers,
         'state': initial_state,
         'clear_results_on_start': clear_results_on_start,
-        'skip_dependents': args.skip_deps
+        'skip_dependents': args.skip_deps,
+        'policy': args.policy,
+        'history_file': args.history_file,
+        'reduce_edges': args.reduce_edges,
+        'executor': args.executor,
+        'task_timeout': args.task_timeout,
+        'resources': args.resources,
+        'max_failures': 1 if args.fail_fast else args.max_failures,
+        'cache_dir': None if args.no_cache else args.cache_dir,
+        'cache_size': args.cache_size,
+        'release_results': args.release_results
     }
     # prefer module-provided logging hook if available
     add_logging_highlights_function = getattr(module, 'add_logging_highlights', None)
@@ -211,14 +380,38 @@ def validate_args(args):
             'Error: the --viewer and --verbose arguments cannot be used together')
     if args.progress and args.viewer:
         raise SystemExit('Error: --progress and --viewer cannot be used together')
-    if args.workers and args.workers < 1:
+    if args.viewer and args.executor == 'async':
+        raise SystemExit('Error: --viewer and --executor async cannot be used together')
+    counts = args.workers.values() if isinstance(args.workers, dict) else [args.workers]
+    if any(count is not None and count < 1 for count in counts):
         raise SystemExit('Error: --workers must be >= 1')
+    if args.resources and any(count < 1 for count in args.resources.values()):
+        raise SystemExit('Error: --resources capacities must be >= 1')
+    if args.fail_fast and args.max_failures is not None:
+        raise SystemExit('Error: --fail-fast and --max-failures cannot be used together')
+    if args.max_failures is not None and args.max_failures < 1:
+        raise SystemExit('Error: --max-failures must be >= 1')
+    if args.cache_size is not None and args.cache_size < 1:
+        raise SystemExit('Error: --cache-size must be > 0')
+    if args.task_timeout is not None and args.task_timeout <= 0:
+        raise SystemExit('Error: --task-timeout must be > 0')
+    if args.with_upstream and '::' not in args.target:
+        raise SystemExit('Error: --with-upstream requires a module.py::name target')
+    if args.last_failed and args.resume:
+        raise SystemExit('Error: --last-failed and --resume cannot be used together')
+    if args.last_failed and '::' in args.target:
+        raise SystemExit('Error: --last-failed cannot be used with a module.py::name target')
 
 def set_effective_workers(args, task_count):
     """ set args.effective_workers to the actual number of workers to use
         based on task count and requested workers.
     """
-    args.effective_workers = args.workers if args.workers else min(default_workers, task_count)
+    workers = default_async_workers if args.executor == 'async' else default_workers
+    if isinstance(args.workers, dict):
+        # per-executor counts; the default executor is still capped by the task count
+        args.effective_workers = {args.executor: min(workers, task_count), **args.workers}
+    else:
+        args.effective_workers = args.workers if args.workers else min(workers, task_count)
 
 def _main(argv=None):
     """ main CLI entry point
@@ -233,14 +426,48 @@ def _main(argv=None):
 
     # collect and optionally filter marked functions
     tags_filter = _parse_tags_filter(args.tags)
+    cache = None if args.no_cache else DiscoveryCache(args.cache_dir)
     module, marked_functions, single_function_mode = load_and_collect_functions(
-        args.target, tags_filter)
+        args.target, tags_filter, with_upstream=args.with_upstream, cache=cache,
+        graph_only=args.graph)
+    module_path = _split_target(args.target)[0]
+    record = RunRecord(args.cache_dir, module_path)
+    journal_file = journal_path(args.cache_dir, module_path)
+    results = None
+    if args.resume:
+        try:
+            statuses, journal_results = read_journal(journal_file)
+        except FileNotFoundError:
+            raise SystemExit(f'Error: there is no interrupted run of {module_path} to resume')
+        # what finished before the run was killed counts as run
+        record.merge(statuses, journal_results)
+        marked_functions, results = select_rerun(marked_functions, statuses, journal_results)
+        if not marked_functions:
+            print('nothing left to resume')
+            return
+    elif args.last_failed:
+        marked_functions, results = record.select_failed(marked_functions)
+        if not marked_functions:
+            print('no failed functions to rerun')
+            return
+    if results is not None:
+        # the dependencies that passed before are not run again
+        initial_state.setdefault('results', {}).update(results)
+        clear_results_on_start = False
     task_count = len(marked_functions)
 
+    if args.graph:
+        print(format_graph_summary(
+            build_graph(marked_functions, tags_filter, single_function_mode)))
+        return
+
     set_effective_workers(args, task_count)
 
     # build scheduler configuration and configure logging
     scheduler_kwargs = _build_scheduler_kwargs(args, initial_state, clear_results_on_start, module)
+    scheduler_kwargs['journal_file'] = journal_file
+    if not args.resume:
+        journal_file.unlink(missing_ok=True)
 
     # allow module to mutate initial state if supported
     _maybe_call_setup_state(module, initial_state)
@@ -249,16 +476,20 @@ def _main(argv=None):
     logger.info(f'collected {task_count} marked functions')
     register_functions(scheduler, marked_functions, tags_filter, single_function_mode)
 
-    if args.graph:
-        print(format_graph_summary(scheduler.graph))
-        return
-
     with _setup_output(scheduler, args):
         summary = scheduler.start()
 
+    record.update([name for name, _, _ in marked_functions], summary,
+                  scheduler.state.get('results', {}))
+    try:
+        record.save()
+        # the run finished; its outcome is in the run record now
+        journal_file.unlink(missing_ok=True)
+    except OSError as exception:
+        logger.warning(f'unable to save run record: {exception}')
+
     # debug final state and print user-facing summary
-    logger.debug('Scheduler::State: ' + json.dumps(
-        scheduler.sanitized_state, indent=2, default=str))
+    logger.debug('Scheduler::State: %s', _StateDump(scheduler))
     print(summary['text'])
 
     if summary.get('failed'):
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+from concurrent.futures import Executor
+
+class AsyncLoopExecutor(Executor):
+    """ run coroutine functions on one event loop owned by a dedicated thread
+
+        submit() takes a coroutine function and returns a concurrent.futures.Future so
+        the scheduler tracks coroutine tasks exactly like thread pool tasks.
+    """
+    def __init__(self, thread_name='asyncio'):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name=thread_name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, /, *args, **kwargs):
+        """ schedule fn(*args, **kwargs) on the event loop
+        """
+        if self._loop.is_closed():
+            raise RuntimeError('cannot schedule new futures after shutdown')
+        return asyncio.run_coroutine_threadsafe(fn(*args, **kwargs), self._loop)
+
+    async def _drain(self, cancel):
+        """ wait for (or cancel) every task still on the loop
+        """
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        if cancel:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """ stop the event loop and its thread; pending coroutines are awaited when wait
+            is set and cancelled when cancel_futures is set
+        """
+        if self._loop.is_closed():
+            return
+        if wait or cancel_futures:
+            asyncio.run_coroutine_threadsafe(self._drain(cancel_futures), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -14,12 +14,57 @@ def log_candidates(candidates, number):
         message = f"{base} {', '.join(candidates)}"
     logger.debug(f'requested {number} {message}')
 
+def _find_cycles(edges):
+    """ return the cycles among `edges` (name → [deps]) as [[name, ..., name], ...]
+
+        Kahn's algorithm peels off every node that is not on or behind a cycle; each
+        leftover node still waits on another leftover node, so walking leftover parents
+        from any of them must come back around to a node already seen on the walk.
+        Dependencies outside `edges` are treated as satisfied. Paths are in execution
+        order (dependency -> dependent).
+    """
+    indegree = {}
+    children = defaultdict(list)
+    for name, after in edges.items():
+        deps = [dep for dep in after if dep in edges]
+        indegree[name] = len(deps)
+        for dep in deps:
+            children[dep].append(name)
+    queue = [name for name, count in indegree.items() if not count]
+    while queue:
+        name = queue.pop()
+        for child in children[name]:
+            indegree[child] -= 1
+            if not indegree[child]:
+                queue.append(child)
+
+    leftover = {name for name, count in indegree.items() if count}
+    cycles = []
+    visited = set()
+    for start in sorted(leftover):
+        if start in visited:
+            continue
+        path = []
+        position = {}
+        node = start
+        while node not in position and node not in visited:
+            position[node] = len(path)
+            path.append(node)
+            node = next(dep for dep in edges[node] if dep in leftover)
+        visited.update(path)
+        if node in position:
+            cycle = path[position[node]:] + [node]
+            cycles.append(list(reversed(cycle)))
+    return cycles
+
 class DAGraph:
 
     def __init__(self):
         """ initialize an empty DAG with parent and child adjacency mappings
         """
-        self._parents = defaultdict(list)
+        # node → remaining (not yet removed) parents; an insertion-ordered dict is used as an
+        # ordered set so its length doubles as the node's remaining-dependency counter
+        self._parents = defaultdict(dict)
         self._children = defaultdict(set)
         self._original_parents = {}
 
@@ -38,33 +83,78 @@ class DAGraph:
         unknowns = [dep for dep in after if dep not in self._parents]
         if unknowns:
             raise ValueError(f'{name} depends on unknown {unknowns}')
-        self._parents[name] = []
+        self._parents[name] = {}
         self._original_parents[name] = list(after) if after else []
         for dep in after:
-            self._parents[name].append(dep)
+            self._parents[name][dep] = None
             self._children[dep].add(name)
         # defensive: future refactor may allow updating deps
-        if self._has_cycle():
+        if self._has_cycle(name):
             # rollback this node to keep DAG consistent
             for dep in after:
                 self._children[dep].discard(name)
             self._parents.pop(name, None)
+            self._original_parents.pop(name, None)
             raise ValueError(f'adding {name} will create a cycle')
 
+    def add_many(self, edges):
+        """ add many nodes at once; `edges` maps name → after (or is an iterable of pairs)
+
+            Unlike add(), nodes may be given in any order and may depend on each other.
+            Everything is validated in one pass before the graph is touched: duplicate
+            names, unknown dependencies and cycles (with the offending path) are reported
+            together in a single ValueError. The adjacency is then built in one shot.
+        """
+        logger = logging.getLogger(threading.current_thread().name)
+        items = edges.items() if hasattr(edges, 'items') else edges
+        new = {}
+        errors = []
+        for name, after in items:
+            if name in self._parents or name in new:
+                errors.append(f'{name} has already been added')
+                continue
+            new[name] = list(after) if after else []
+
+        for name, after in new.items():
+            unknowns = [dep for dep in after if dep not in self._parents and dep not in new]
+            if unknowns:
+                errors.append(f'{name} depends on unknown {unknowns}')
+
+        for cycle in _find_cycles(new):
+            errors.append(f"cycle detected: {' -> '.join(cycle)}")
+
+        if errors:
+            raise ValueError('; '.join(errors))
+
+        logger.debug(f'add {len(new)} nodes')
+        for name, after in new.items():
+            self._parents[name] = dict.fromkeys(after)
+            self._original_parents[name] = after
+            for dep in after:
+                self._children[dep].add(name)
+
+    @classmethod
+    def from_edges(cls, edges):
+        """ build a new DAGraph from a mapping of name → after, given in any order
+        """
+        graph = cls()
+        graph.add_many(edges)
+        return graph
+
     def remove(self, name):
         """ remove a completed node and detach it from all dependent children
 
             Cleans up parent and child relationships and drops the node completely
-            once it has no remaining edges.
+            once it has no remaining edges. Costs O(out-degree).
         """
         logger = logging.getLogger(threading.current_thread().name)
         for child in self._children.pop(name, ()):
             logger.debug(f'removing {name} as a dependency from {child}')
-            try:
-                self._parents[child].remove(name)
-            except ValueError:
-                # defensive: graph might already be partially cleaned
-                pass
+            parents = self._parents.get(child)
+            # defensive: graph might already be partially cleaned
+            if parents is None or name not in parents:
+                continue
+            del parents[name]
 
         if name in self._parents and not self._parents[name]:
             logger.debug(f'removing {name} from dependency graph')
@@ -80,7 +170,9 @@ class DAGraph:
     def get_candidates(self, active, number, sort=True):
         """ return up to `number` ready nodes, optionally sorted for stable scheduling
 
-            Also logs the candidate list for visibility.
+            The Scheduler dispatches from a PlanCursor, which keeps the ready queue of a
+            run; this scan is for walking a DAGraph directly. Also logs the candidate list
+            for visibility.
         """
         candidates = self.ready(active)
         if sort:
@@ -88,25 +180,138 @@ class DAGraph:
         log_candidates(candidates, number)
         return candidates[:number]
 
-    def _has_cycle(self):
+    def compile(self, ranks=None, reduce=False):
+        """ return an immutable ExecutionPlan of every node added to the graph
+
+            The plan is built from the declared dependencies, so compiling is unaffected
+            by remove() calls; `ranks` sets the dispatch priority of ready nodes. With
+            `reduce` the plan schedules on the transitive reduction of the declared edges
+            while still reporting the declared ones as its original parents.
+        """
+        from .plan import ExecutionPlan
+        if reduce:
+            return ExecutionPlan(self.transitive_reduction(), self._original_parents, ranks)
+        return ExecutionPlan(self._original_parents, ranks=ranks)
+
+    def transitive_reduction(self):
+        """ return {name: [parents]} of the declared edges without redundant ones
+
+            A dependency is redundant when it is already an ancestor of another dependency
+            of the same node (e.g. depending on both a and a's child). Ancestor sets are
+            kept as integer bitsets in topological order and released once all of a node's
+            children have been visited.
+        """
+        order = self._topological_order()
+        index = {name: position for position, name in enumerate(order)}
+        unvisited = defaultdict(int)
+        for name in order:
+            for dep in dict.fromkeys(self._original_parents[name]):
+                unvisited[dep] += 1
+        ancestors = {}
+        reduced = {}
+        for name in order:
+            deps = list(dict.fromkeys(self._original_parents[name]))
+            covered = 0
+            for dep in deps:
+                covered |= ancestors[dep]
+            reduced[name] = [dep for dep in deps if not covered >> index[dep] & 1]
+            for dep in deps:
+                covered |= 1 << index[dep]
+                unvisited[dep] -= 1
+                if not unvisited[dep]:
+                    del ancestors[dep]
+            if unvisited[name]:
+                ancestors[name] = covered
+        return reduced
+
+    def _topological_order(self):
+        """ return every declared node with each node after all of its dependencies
+        """
+        children = defaultdict(list)
+        pending = {}
+        for name, after in self._original_parents.items():
+            deps = dict.fromkeys(after)
+            pending[name] = len(deps)
+            for dep in deps:
+                children[dep].append(name)
+        order = [name for name, count in pending.items() if not count]
+        for name in order:
+            for child in children[name]:
+                pending[child] -= 1
+                if not pending[child]:
+                    order.append(child)
+        return order
+
+    def upward_ranks(self, weights=None):
+        """ return {name: rank} where rank is the weight of the heaviest path from the node
+            down to any leaf, the node itself included
+
+            `weights` maps name → cost and defaults to 1 per node, in which case the rank is
+            the number of nodes on the longest downstream chain. Computed over the declared
+            edges in reverse topological order in O(N + E).
+        """
+        weights = weights or {}
+        children = defaultdict(list)
+        pending = {}
+        for name, after in self._original_parents.items():
+            pending.setdefault(name, 0)
+            for dep in after:
+                children[dep].append(name)
+                pending[dep] = pending.get(dep, 0) + 1
+        ranks = {}
+        stack = [name for name, count in pending.items() if not count]
+        while stack:
+            name = stack.pop()
+            below = max((ranks[child] for child in children[name]), default=0)
+            ranks[name] = weights.get(name, 1) + below
+            for dep in self._original_parents.get(name, ()):
+                pending[dep] -= 1
+                if not pending[dep]:
+                    stack.append(dep)
+        return ranks
+
+    def _has_cycle(self, start=None):
         """ return True if DAGraph contains a cycle
+
+            When `start` is given only cycles through that node are looked for by walking
+            its descendants; a freshly added node has none, so the check is O(1) and
+            registering N nodes stays linear. Both walks are iterative so very deep
+            chains cannot hit the recursion limit.
         """
-        visited = set()
-        stack = set()
-
-        def visit(node):
-            if node in stack:
-                return True
-            if node in visited:
-                return False
-            visited.add(node)
-            stack.add(node)
-            for neighbor in self._parents[node]:
-                if visit(neighbor):
+        if start is not None:
+            stack = list(self._children.get(start, ()))
+            seen = set()
+            while stack:
+                node = stack.pop()
+                if node == start:
                     return True
-            stack.remove(node)
+                if node in seen:
+                    continue
+                seen.add(node)
+                stack.extend(self._children.get(node, ()))
             return False
-        return any(visit(node) for node in self._parents)
+
+        visited = set()
+        for root in self._parents:
+            if root in visited:
+                continue
+            visited.add(root)
+            on_path = {root}
+            stack = [(root, iter(self._parents.get(root, ())))]
+            while stack:
+                node, neighbors = stack[-1]
+                for neighbor in neighbors:
+                    if neighbor in on_path:
+                        return True
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        on_path.add(neighbor)
+                        stack.append((neighbor, iter(self._parents.get(neighbor, ()))))
+                        break
+                else:
+                    stack.pop()
+                    on_path.discard(node)
+        return False
 
     def is_empty(self):
         """ return True if the DAGraph has no nodes
@@ -116,7 +321,7 @@ class DAGraph:
     def __repr__(self):
         """ return a human-readable representation of the dependency graph
         """
-        parents = '\n'.join(f'{n}: {self._parents[n]}' for n in sorted(self._parents))
+        parents = '\n'.join(f'{n}: {list(self._parents[n])}' for n in sorted(self._parents))
         children = '\n'.join(
             f'{n}: {sorted(list(self._children[n]))}' for n in sorted(self._children))
         return f'Parents:\n{parents}\nChildren:\n{children}'
@@ -141,6 +346,19 @@ class DAGraph:
         """
         return list(self._original_parents.get(name, []))
 
+    def ancestors_of(self, name):
+        """ return the set of nodes name transitively depends on, as declared
+        """
+        ancestors = set()
+        stack = list(self._original_parents.get(name, ()))
+        while stack:
+            node = stack.pop()
+            if node in ancestors:
+                continue
+            ancestors.add(node)
+            stack.extend(self._original_parents.get(node, ()))
+        return ancestors
+
     @property
     def parent_child_counts(self):
         """ return [(parent_name, child_count), ...] for all parents in the graph.
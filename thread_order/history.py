@@ -0,0 +1,82 @@
+"""
+Per-task timing history for thread_order.
+
+Durations of passed tasks are persisted to a small JSON file between runs so
+the Scheduler can weight its critical-path ranks by how long tasks actually
+take instead of counting every task as one unit of work.
+"""
+import os
+import json
+import inspect
+from pathlib import Path
+
+def task_key(name, function):
+    """ return the history key for a task: '<absolute module path>::<task name>'
+    """
+    function = inspect.unwrap(function)
+    code = getattr(function, '__code__', None)
+    if code is not None:
+        module_path = os.path.abspath(code.co_filename)
+    else:
+        module_path = getattr(function, '__module__', None) or ''
+    return f'{module_path}::{name}'
+
+class TimingHistory:
+    """ task durations keyed by task_key(), smoothed across runs
+    """
+    def __init__(self, path, smoothing=0.5):
+        """ load history from path if it exists; smoothing is the weight given to the
+            newest duration when blending it with the recorded one
+        """
+        self._path = Path(path)
+        self._smoothing = smoothing
+        self._durations = {}
+        self.load()
+
+    def load(self):
+        """ read durations from disk; a missing or unreadable file starts an empty history
+        """
+        try:
+            with open(self._path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        durations = data.get('durations') if isinstance(data, dict) else None
+        if isinstance(durations, dict):
+            self._durations = {
+                key: float(value) for key, value in durations.items()
+                if isinstance(value, (int, float))}
+
+    def save(self):
+        """ write durations to disk, replacing the file atomically
+        """
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self._path.with_name(f'{self._path.name}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'durations': self._durations}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self._path)
+
+    def get(self, key, default=None):
+        """ return the recorded duration for key
+        """
+        return self._durations.get(key, default)
+
+    def record(self, key, duration):
+        """ blend a new duration into the recorded one
+        """
+        previous = self._durations.get(key)
+        if previous is None:
+            self._durations[key] = duration
+        else:
+            self._durations[key] = (
+                self._smoothing * duration + (1 - self._smoothing) * previous)
+
+    def weights(self, keys):
+        """ return {name: duration} for {name: key}, filling in tasks never seen before
+            with the mean recorded duration so they still count towards a path's length;
+            with no recorded durations at all every task weighs 1 (the structural rank)
+        """
+        known = {name: self._durations[key] for name, key in keys.items()
+                 if key in self._durations}
+        fallback = sum(known.values()) / len(known) if known else 1
+        return {name: known.get(name, fallback) for name in keys}
@@ -0,0 +1,164 @@
+"""
+Checkpoint journal for thread_order.
+
+The Scheduler appends one JSON line per finished task to the journal as the
+run goes, so the progress of a run that was killed part way (an OOM kill, a
+preempted VM) is not lost: read_journal() returns what finished and the
+results that could be stored, and tdrun --resume continues from there.
+Entries are handed to a thread of the journal's own, which serializes them,
+flushes them to the operating system as they come and syncs them to disk in
+batches, so the scheduler never waits on JSON encoding, a write or a fsync.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from .cache import module_key
+
+class Journal:
+    """ append-only JSON lines log of finished tasks
+    """
+    def __init__(self, path, sync_every=64, sync_interval=1.0):
+        """ sync to disk once sync_every lines are pending or sync_interval seconds have
+            passed since the last sync, whichever comes first
+        """
+        self._path = Path(path)
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._file = None
+        # guards the entries and counters shared with the thread that writes the journal
+        self._condition = threading.Condition()
+        # (name, status, result, has_result) appended but not written yet
+        self._entries = []
+        # lines written but not synced yet
+        self._pending = 0
+        self._synced_at = 0
+        self._closing = False
+        self._syncer = None
+
+    def open(self):
+        """ open the journal for appending, creating it if needed, and start the thread
+            that writes and syncs it
+        """
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self._path, 'a', encoding='utf-8')
+        self._entries = []
+        self._pending = 0
+        self._synced_at = time.monotonic()
+        self._closing = False
+        self._syncer = threading.Thread(target=self._sync_loop, name='journal', daemon=True)
+        self._syncer.start()
+
+    def append(self, name, status, result=None, has_result=False):
+        """ queue the outcome of a task for the journal's thread to write; result is kept
+            only when has_result is set and it can be stored as JSON
+
+            result is serialized later on that thread, so it must not be changed meanwhile
+        """
+        with self._condition:
+            self._entries.append((name, status, result, has_result))
+            self._condition.notify()
+
+    def _write(self, entries):
+        """ write one line per entry and flush them
+        """
+        for name, status, result, has_result in entries:
+            entry = {'name': name, 'status': status}
+            if has_result:
+                try:
+                    line = json.dumps({**entry, 'result': result})
+                except (TypeError, ValueError):
+                    line = json.dumps(entry)
+            else:
+                line = json.dumps(entry)
+            self._file.write(line + '\n')
+        # a killed process loses nothing already flushed; only a crash of the machine
+        # can lose what is flushed but not yet synced
+        self._file.flush()
+
+    def _sync_due(self):
+        return bool(self._pending) and (
+            self._pending >= self._sync_every
+            or time.monotonic() - self._synced_at >= self._sync_interval)
+
+    def _sync_loop(self):
+        """ write entries as they are appended and fsync the journal whenever a sync is
+            due, so appending never waits on encoding or the disk; entries still queued
+            when the journal is closed are written before the thread ends
+        """
+        while True:
+            with self._condition:
+                while not self._closing and not self._entries and not self._sync_due():
+                    timeout = None
+                    if self._pending:
+                        timeout = self._synced_at + self._sync_interval - time.monotonic()
+                    self._condition.wait(timeout)
+                entries, self._entries = self._entries, []
+                closing = self._closing
+            if entries:
+                self._write(entries)
+            with self._condition:
+                self._pending += len(entries)
+                if closing or not self._sync_due():
+                    due = False
+                else:
+                    due, pending = True, self._pending
+            if closing:
+                return
+            if due:
+                os.fsync(self._file.fileno())
+                with self._condition:
+                    self._pending -= pending
+                    self._synced_at = time.monotonic()
+
+    def sync(self):
+        """ force the lines written so far to disk
+        """
+        with self._condition:
+            pending = self._pending
+        if self._file and pending:
+            os.fsync(self._file.fileno())
+        with self._condition:
+            self._pending -= pending
+            self._synced_at = time.monotonic()
+
+    def close(self):
+        """ stop the journal's thread once it has written every entry, then sync and
+            close the journal
+        """
+        if self._syncer:
+            with self._condition:
+                self._closing = True
+                self._condition.notify()
+            self._syncer.join()
+            self._syncer = None
+        if self._file:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+def journal_path(directory, module_path):
+    """ return where tdrun keeps the journal of runs of module_path
+    """
+    return Path(directory) / 'journals' / f'{module_key(module_path)}.jsonl'
+
+def read_journal(path):
+    """ return (statuses, results): {name: status} of the last entry of every task in a
+        journal and {name: result} of those entries that stored one; a line cut short by
+        a crash is ignored
+    """
+    statuses = {}
+    results = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                name = entry['name']
+                statuses[name] = entry['status']
+            except (ValueError, KeyError, TypeError):
+                continue
+            results.pop(name, None)
+            if 'result' in entry:
+                results[name] = entry['result']
+    return statuses, results
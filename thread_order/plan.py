@@ -0,0 +1,218 @@
+"""
+Compiled execution plans for thread_order.
+
+An ExecutionPlan is an immutable snapshot of a DAGraph: frozen adjacency,
+precomputed indegrees and dispatch priorities. Each run walks the plan with
+its own PlanCursor, so the same plan can be executed any number of times
+without rebuilding or revalidating the graph.
+"""
+import copy
+import heapq
+from .graph import log_candidates
+
+class ExecutionPlan:
+    """ frozen adjacency, indegrees and priorities of a validated DAG
+    """
+    def __init__(self, parents, original_parents=None, ranks=None):
+        """ build a plan from {name: [parents]} of an already validated (acyclic) graph
+
+            `original_parents` are the dependencies as declared by the user when they
+            differ from the edges scheduled on; `ranks` orders ready nodes highest first,
+            ties broken by name.
+        """
+        ranks = ranks or {}
+        self._parents = {name: tuple(dict.fromkeys(after)) for name, after in parents.items()}
+        if original_parents is None:
+            self._original_parents = self._parents
+        else:
+            self._original_parents = {
+                name: tuple(after) for name, after in original_parents.items()}
+        children = {name: [] for name in self._parents}
+        for name, after in self._parents.items():
+            for dep in after:
+                children[dep].append(name)
+        self._children = {name: tuple(sorted(kids)) for name, kids in children.items()}
+        self._indegree = {name: len(after) for name, after in self._parents.items()}
+        self._position = {name: index for index, name in enumerate(self._topological_order())}
+        # name → descendants in topological order, filled in on first use and kept with the plan
+        self._descendants = {}
+        self._set_ranks(ranks)
+
+    def _set_ranks(self, ranks):
+        # heap entries for the ready queue, built once and shared by every cursor
+        self._entries = {name: (-ranks.get(name, 0), name) for name in self._parents}
+        self._roots = tuple(
+            self._entries[name] for name, count in self._indegree.items() if not count)
+
+    def __len__(self):
+        return len(self._parents)
+
+    def reranked(self, ranks):
+        """ return a plan with the same nodes and edges that orders ready nodes by `ranks`
+            instead; costs O(N), the adjacency is shared rather than rebuilt
+        """
+        plan = copy.copy(self)
+        plan._set_ranks(ranks or {})
+        return plan
+
+    def _topological_order(self):
+        """ return the node names in an order where every node follows its parents
+        """
+        indegree = dict(self._indegree)
+        order = [name for name, count in indegree.items() if not count]
+        for name in order:
+            for child in self._children[name]:
+                indegree[child] -= 1
+                if not indegree[child]:
+                    order.append(child)
+        return order
+
+    def cursor(self):
+        """ return a fresh cursor positioned at the start of a run
+        """
+        return PlanCursor(self)
+
+    def nodes(self):
+        """ return an iterable of node names in the plan
+        """
+        return self._parents.keys()
+
+    def parents_of(self, name):
+        """ return the dependencies scheduled on for a given node
+        """
+        return self._parents.get(name, ())
+
+    def children_of(self, name):
+        """ return the dependents scheduled on for a given node
+        """
+        return self._children.get(name, ())
+
+    def original_parents_of(self, name):
+        """ return the dependencies of a given node as originally declared
+        """
+        return self._original_parents.get(name, ())
+
+    def descendants_of(self, name):
+        """ return every node reachable from a given node, in topological order
+
+            computed once per node and cached, so every run of the plan reuses it
+        """
+        descendants = self._descendants.get(name)
+        if descendants is None:
+            seen = set()
+            stack = list(self._children.get(name, ()))
+            while stack:
+                node = stack.pop()
+                if node not in seen:
+                    seen.add(node)
+                    stack.extend(self._children[node])
+            descendants = tuple(sorted(seen, key=self._position.__getitem__))
+            self._descendants[name] = descendants
+        return descendants
+
+class PlanCursor:
+    """ the mutable per-run position in an ExecutionPlan
+
+        Tracks the remaining-dependency counter of every node not yet done and a heap
+        of ready nodes. Completing a node costs O(out-degree) and pulling k candidates
+        O(k log R).
+    """
+    def __init__(self, plan):
+        self._plan = plan
+        # node → remaining-dependency counter; a node leaves once it is done
+        self._pending = dict(plan._indegree)
+        self._ready = list(plan._roots)
+        heapq.heapify(self._ready)
+        # key → heap of ready nodes that were not admitted while key was exhausted
+        self._parked = {}
+        # keys released since parked nodes were last reconsidered
+        self._released = set()
+
+    def get_candidates(self, active, number=None, admit=None):
+        """ pop up to `number` (default: any number of) ready nodes, highest priority
+            first, for submission
+
+            with `admit`, a node is only handed out when admit(name) returns None;
+            otherwise it is parked under the key admit() returned (the capacity the node
+            waits for) until release(key) is called. Returned nodes are handed out and
+            will not be returned again. Also logs the candidate list for visibility.
+        """
+        candidates = []
+        limit = len(self._pending) if number is None else number
+        while len(candidates) < limit:
+            source = self._next_source()
+            if source is None:
+                break
+            entry = heapq.heappop(source)
+            name = entry[1]
+            # skip nodes already done or currently running
+            if name not in self._pending or name in active:
+                continue
+            blocker = admit(name) if admit else None
+            if blocker is None:
+                candidates.append(name)
+            else:
+                heapq.heappush(self._parked.setdefault(blocker, []), entry)
+                # nothing else parked on an exhausted key can be admitted either
+                self._released.discard(blocker)
+        log_candidates(candidates, 'any' if number is None else number)
+        return candidates
+
+    def _next_source(self):
+        """ return the heap holding the highest priority node to consider next: the ready
+            queue or the parked nodes of a released key
+        """
+        source = self._ready if self._ready else None
+        for key in list(self._released):
+            parked = self._parked.get(key)
+            if not parked:
+                self._released.discard(key)
+            elif source is None or parked[0] < source[0]:
+                source = parked
+        return source
+
+    def requeue(self, name):
+        """ make a node that was handed out but not done ready again, e.g. to retry it
+        """
+        if name in self._pending:
+            heapq.heappush(self._ready, self._plan._entries[name])
+
+    def release(self, key):
+        """ note that capacity under key was given back so nodes parked on it are
+            reconsidered by the next get_candidates()
+        """
+        if self._parked.get(key):
+            self._released.add(key)
+
+    def remove(self, name):
+        """ mark a node done and release every dependent whose counter drops to zero
+        """
+        if self._pending.pop(name, None) is None:
+            return
+        entries = self._plan._entries
+        for child in self._plan._children[name]:
+            count = self._pending.get(child)
+            if count is None:
+                continue
+            count -= 1
+            self._pending[child] = count
+            if not count:
+                heapq.heappush(self._ready, entries[child])
+
+    def prune(self, name):
+        """ drop every descendant of a node that is not done yet, e.g. because the node
+            failed, and return them in topological order
+
+            the descendants of a node that is not done cannot have been handed out and
+            every child of a descendant is itself a descendant, so no counter needs updating
+        """
+        pending = self._pending
+        pruned = [node for node in self._plan.descendants_of(name) if node in pending]
+        for node in pruned:
+            del pending[node]
+        return pruned
+
+    def is_empty(self):
+        """ return True once every node in the plan is done
+        """
+        return not self._pending
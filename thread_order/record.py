@@ -0,0 +1,119 @@
+"""
+Run records for thread_order.
+
+tdrun keeps a compact record of the last outcome of every function in a
+module, and the return values of those that succeeded when they can be
+stored as JSON, so a later run can rerun only what failed (--last-failed)
+and take the results of the functions they depend on from the record
+instead of running those again.
+"""
+import json
+from pathlib import Path
+from .cache import _write_json, module_key
+
+# outcomes after which a function does not have to run again
+DONE_STATUSES = ('PASSED', 'CACHED', 'UP_TO_DATE')
+# summary lists holding the tasks of each outcome
+_SUMMARY_STATUSES = {
+    'passed': 'PASSED',
+    'failed': 'FAILED',
+    'skipped': 'SKIPPED',
+    'cached': 'CACHED',
+    'up_to_date': 'UP_TO_DATE',
+}
+
+class RunRecord:
+    """ last status of every function of a module and the results that could be stored
+    """
+    def __init__(self, directory, module_path):
+        """ load the record of module_path kept in directory, if there is one
+        """
+        self._path = Path(directory) / 'runs' / f'{module_key(module_path)}.json'
+        # function name → status of its last run
+        self.statuses = {}
+        # function name → JSON-serializable result of its last successful run
+        self.results = {}
+        self.load()
+
+    def load(self):
+        """ read the record from disk; a missing or unreadable file starts an empty record
+        """
+        try:
+            with open(self._path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and isinstance(data.get('statuses'), dict):
+            self.statuses = data['statuses']
+            results = data.get('results')
+            self.results = results if isinstance(results, dict) else {}
+
+    def save(self):
+        """ write the record to disk, replacing the file atomically
+        """
+        _write_json(self._path, {'statuses': self.statuses, 'results': self.results})
+
+    def update(self, names, summary, results):
+        """ record the outcome of a run of the functions in names from its summary and
+            state['results']; functions the run never got to are forgotten so they
+            count as failed
+        """
+        statuses = {}
+        for key, status in _SUMMARY_STATUSES.items():
+            statuses.update(dict.fromkeys(summary.get(key, ()), status))
+        for name in names:
+            self.results.pop(name, None)
+            status = statuses.get(name)
+            if status is None:
+                self.statuses.pop(name, None)
+                continue
+            self.statuses[name] = status
+            if status in DONE_STATUSES and name in results:
+                try:
+                    json.dumps(results[name])
+                except (TypeError, ValueError):
+                    continue
+                self.results[name] = results[name]
+
+    def merge(self, statuses, results):
+        """ take over {name: status} and the stored {name: result} of finished functions,
+            e.g. read from the journal of an interrupted run
+        """
+        for name, status in statuses.items():
+            self.statuses[name] = status
+            self.results.pop(name, None)
+            if name in results:
+                self.results[name] = results[name]
+
+    def select_failed(self, functions):
+        """ return select_rerun() of the collected functions for this record
+        """
+        return select_rerun(functions, self.statuses, self.results)
+
+def select_rerun(functions, statuses, results):
+    """ return (functions, results): the collected functions that failed, were skipped or
+        did not run according to statuses, plus the dependencies they need whose results
+        were not stored, and the stored results of the dependencies that need not run
+
+        dependencies outside the selection are removed from the returned metadata
+    """
+    after = {name: list(meta.get('after') or []) for name, _, meta in functions}
+    rerun = [name for name in after if statuses.get(name) not in DONE_STATUSES]
+    selected = set()
+    rehydrated = {}
+    while rerun:
+        name = rerun.pop()
+        if name in selected:
+            continue
+        selected.add(name)
+        for dep in after[name]:
+            if dep not in after or dep in selected:
+                continue
+            if statuses.get(dep) in DONE_STATUSES and dep in results:
+                rehydrated[dep] = results[dep]
+            else:
+                rerun.append(dep)
+    selected_functions = [
+        (name, function, {**meta, 'after': [d for d in after[name] if d in selected]})
+        for name, function, meta in functions if name in selected]
+    return selected_functions, rehydrated
@@ -1,17 +1,31 @@
 import os
+import sys
 import queue
 import threading
 import logging
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, CancelledError
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
 from functools import wraps
+from contextlib import contextmanager, ExitStack
+from collections.abc import Mapping
 from enum import Enum
 from pathlib import Path
 import importlib.util
+import multiprocessing
+import pickle
 import ast
 import inspect
+import time
+import heapq
+import asyncio
+from .cache import ResultCache, DEFAULT_RESULT_CACHE_SIZE, function_digest, value_digest, result_key
+from .capacity import Capacity
+from .executors import AsyncLoopExecutor
 from .graph import DAGraph
+from .history import TimingHistory, task_key
+from .journal import Journal
 from .timer import Timer
+from .uptodate import FileStats, BuildRecords, input_digests, is_up_to_date
 from .logger import configure_logging
 try:
     from colorama import Fore, Style
@@ -20,11 +34,28 @@ except ImportError:
     HAS_COLOR = False
 
 default_workers = min(8, os.cpu_count())
+# concurrency limit of the async executor; coroutines waiting on I/O hold no thread
+default_async_workers = 1000
+# longest time the scheduler thread sleeps on the event queue without an event arriving;
+# only bounds how often an idle scheduler wakes up (e.g. to notice Ctrl-C on Windows)
+IDLE_WAKEUP = 1.0
+# order in which ready tasks are dispatched when there are more of them than free workers
+POLICIES = ('alphabetical', 'critical_path')
+# how tasks are run: 'thread' runs each task on a pool thread, 'process' in a pool of worker
+# processes, 'async' runs every task as a coroutine on one event loop (plain functions are
+# handed off to a thread)
+EXECUTORS = ('thread', 'process', 'async')
+# per-task options accepted by register() and mark()
+TASK_OPTIONS = (
+    'executor', 'timeout', 'retries', 'backoff', 'resources', 'exclusive', 'slots', 'cache',
+    'cache_inputs', 'inputs', 'outputs', 'keep_result')
 
 class TaskStatus(Enum):
     PASSED = 'PASSED'
     FAILED = 'FAILED'
     SKIPPED = 'SKIPPED'
+    CACHED = 'CACHED'
+    UP_TO_DATE = 'UP_TO_DATE'
 
 class Scheduler:
     """ run functions concurrently across multiple threads while maintaining a defined
@@ -32,15 +63,41 @@ class Scheduler:
     """
     def __init__(self, workers=None, setup_logging=False, add_stream_handler=True,
                  state=None, store_results=True, clear_results_on_start=True, verbose=False,
-                 skip_dependents=False, add_file_handler=True, highlights=None):
+                 skip_dependents=False, add_file_handler=True, highlights=None,
+                 policy='alphabetical', history_file=None, reduce_edges=False,
+                 executor='thread', task_timeout=None, resources=None, max_failures=None,
+                 cache_dir=None, cache_size=None, journal_file=None, release_results=False):
         """ initialize scheduler with thread pool size, logging, and callback placeholders
         """
-        # number of concurrent worker threads in the pool
-        self._workers = workers if workers else default_workers
+        if policy not in POLICIES:
+            raise ValueError(f'policy must be one of {POLICIES}')
+        if executor not in EXECUTORS:
+            raise ValueError(f'executor must be one of {EXECUTORS}')
+        _check_timeout(task_timeout)
+        _check_counts('resources', resources)
+        if max_failures is not None and (
+                isinstance(max_failures, bool) or not isinstance(max_failures, int)
+                or max_failures < 1):
+            raise ValueError('max_failures must be a positive integer')
+        if cache_size is not None and (
+                isinstance(cache_size, bool) or not isinstance(cache_size, int)
+                or cache_size < 1):
+            raise ValueError('cache_size must be a positive number of bytes')
+        # executor of tasks that do not choose one
+        self._executor_kind = executor
+        # executor → number of its tasks running at once (worker threads for 'thread')
+        self._pool_sizes = _pool_sizes(workers, executor)
+        self._workers = self._pool_sizes[executor]
         # task name → callable object to execute
         self._callables = {}
+        # task name → per-task options (see TASK_OPTIONS)
+        self._options = {}
         # direct acyclic graph
         self._graph = DAGraph()
+        # compiled, reusable form of the graph (built on first start())
+        self._plan = None
+        # per-run position in the plan
+        self._cursor = None
         # protects access to _futures (shared by scheduler and worker threads)
         self._lock = threading.Lock()
         # currently running task names
@@ -49,8 +106,12 @@ class Scheduler:
         self._futures = {}
         # signals scheduler when all tasks have completed
         self._completed = threading.Event()
-        # ThreadPoolExecutor instance (managed inside start())
-        self._executor = None
+        # executor → ThreadPoolExecutor or AsyncLoopExecutor instance (managed inside start())
+        self._executors = {}
+        # ProcessPoolExecutor the 'process' executor's threads hand their tasks to
+        self._process_pool = None
+        # module name → file path of task modules, for processes that do not fork
+        self._process_modules = {}
         # thread-safe queue for passing start/done events from workers to scheduler
         self._events = queue.Queue()
 
@@ -62,6 +123,30 @@ class Scheduler:
         self._results = {}
         self._failed = []
         self._skipped = []
+        self._cached = []
+        # task name → seconds spent running its callable
+        self._durations = {}
+        # resource class → number of tokens; tasks claim them with the resources option
+        self._resources = dict(resources or {})
+        # free worker slots per executor and tokens per resource class; tasks are
+        # dispatched only when they fit
+        self._capacity = None
+        # task name → capacity units it holds while running
+        self._demands = {}
+        self._claims = {}
+        # capacity key → (task name, units) of the multi-unit task first in line for it
+        self._reservations = {}
+        # task name → expected seconds it runs (from the timing history) and, while it
+        # runs, when it was dispatched; used to backfill around reservations
+        self._estimates = {}
+        self._dispatched_at = {}
+        # task name → number of times it was submitted this run
+        self._attempts = {}
+        # heap of (due time, sequence, task name) of failed tasks waiting to be retried
+        self._timers = []
+        self._timer_sequence = 0
+        # tasks waiting on a timer; they hold no worker slot until they are due
+        self._waiting = set()
 
         # user-defined callbacks
         self._on_task_start = None
@@ -76,69 +161,474 @@ class Scheduler:
         self._clear_results_on_start = clear_results_on_start
         self.state_lock = threading.RLock()
         self.state.setdefault('_state_lock', self.state_lock)
+        # set when the run is being cancelled; long running tasks can poll it to exit early
+        self.cancel_event = threading.Event()
+        self.state.setdefault('_cancel', self.cancel_event)
         if 'results' not in self.state and store_results:
             self.state['results'] = {}
 
         self._prefix = 'thread'
         if setup_logging:
-            configure_logging(self._workers, prefix=self._prefix, verbose=verbose,
+            # the async executor runs every coroutine on the single thread '{prefix}_0'
+            threads = 1 if executor == 'async' else self._workers
+            configure_logging(threads, prefix=self._prefix, verbose=verbose,
                               add_stream_handler=add_stream_handler,
                               add_file_handler=add_file_handler,
                               highlights=highlights)
         self._skip_dependents = skip_dependents
-
-    def register(self, obj, name, after=None, with_state=False):
+        self._policy = policy
+        # durations persisted across runs; weights critical_path ranks when available
+        self._history = TimingHistory(history_file) if history_file else None
+        # schedule on the transitive reduction of the declared dependencies
+        self._reduce_edges = reduce_edges
+        # seconds a task may run before it is failed with a TimeoutError, unless it sets
+        # a timeout of its own
+        self._task_timeout = task_timeout
+        # number of failed tasks after which the run is cancelled (fail fast)
+        self._max_failures = max_failures
+        # set once the run is cancelled; nothing new is dispatched
+        self._stopping = False
+        # results of tasks marked with cache=True, stored between runs
+        self._result_cache = ResultCache(
+            cache_dir, cache_size or DEFAULT_RESULT_CACHE_SIZE) if cache_dir else None
+        # task name → result cache key (None when its result cannot be cached this run)
+        self._cache_keys = {}
+        # tasks whose result was taken from the cache this run
+        self._cache_hits = set()
+        # function → digest of its source
+        self._source_digests = {}
+        # task name → digest of its result, taken by the worker that produced it for the
+        # cache keys of dependents marked with cache=True
+        self._result_digests = {}
+        # tasks whose result digest the cache key of a dependent needs
+        self._digest_for = set()
+        # thread that checks outputs and looks results up in the cache before a task is
+        # dispatched, so the scheduler thread never hashes files or unpickles results
+        self._lookup_pool = None
+        # tasks checked by the lookup thread this run
+        self._looked_up = set()
+        # task name → True when its declared outputs are up to date with its inputs
+        self._up_to_date = {}
+        # stats of the files tasks declare as inputs and outputs, gathered once per run
+        self._file_stats = FileStats()
+        # digests of the inputs each task's outputs were last built from
+        self._build_records = BuildRecords(cache_dir) if cache_dir else None
+        # checkpoint of finished tasks, appended to as the run goes
+        self._journal = Journal(journal_file) if journal_file else None
+        # drop a task's result from state['results'] once every task declared after it is done
+        self._release_results = release_results
+        # task name → number of tasks declared after it that are not done yet
+        self._consumers = {}
+
+    def register(self, obj, name, after=None, with_state=False, **options):
         """ register a callable for execution, optionally dependent on other tasks
+
+            options are per-task settings named in TASK_OPTIONS, e.g. executor='process'
         """
         if not callable(obj):
             raise ValueError('object must be callable')
+        options = _check_options(options)
         self._graph.add(name, after=after)
         self._callables[name] = (obj, with_state)
+        self._options[name] = options
+        self._plan = None
 
-    def dregister(self, after=None, with_state=False):
+    def register_many(self, tasks):
+        """ register many callables at once from a mapping of name → (obj, after, with_state)
+            or name → (obj, after, with_state, options)
+
+            Tasks may be given in any order; dependencies between them are resolved in
+            one pass and all validation errors are reported together.
+        """
+        items = list(tasks.items() if hasattr(tasks, 'items') else tasks)
+        not_callable = [name for name, task in items if not callable(task[0])]
+        if not_callable:
+            raise ValueError(f'objects must be callable: {not_callable}')
+        options = {name: _check_options(task[3] if len(task) > 3 else {})
+                   for name, task in items}
+        self._graph.add_many((name, task[1]) for name, task in items)
+        for name, task in items:
+            self._callables[name] = (task[0], task[2])
+            self._options[name] = options[name]
+        self._plan = None
+
+    def dregister(self, after=None, with_state=False, **options):
         """ decorator form of register() for convenient inline task definition
         """
         def decorator(function):
-            @wraps(function)
-            def wrapper(*args, **kwargs):
-                return function(*args, **kwargs)
+            wrapper = _wrap(function)
             # register at decoration time so start() can discover it
-            self.register(wrapper, function.__name__, after=after, with_state=with_state)
+            self.register(wrapper, function.__name__, after=after, with_state=with_state,
+                          **options)
             # keep a pointer to the original
             wrapper.__original__ = function
             return wrapper
         return decorator
 
-    def _maybe_schedule_next(self, logger):
-        """ schedule next ready tasks if there are free worker slots
+    def _executor_of(self, name):
+        """ return the executor a task runs on
+        """
+        return self._options.get(name, {}).get('executor', self._executor_kind)
+
+    def _timeout_of(self, name):
+        """ return the seconds a task may run, or None for no limit
+        """
+        return self._options.get(name, {}).get('timeout', self._task_timeout)
+
+    def _maybe_retry(self, name, error_type, logger):
+        """ put a failed task back on a timer if it has retries left; return True if so
+
+            the task stays pending in the plan but holds no worker slot while it waits;
+            the n-th retry waits backoff * 2 ** (n - 1) seconds; once the run is cancelled
+            nothing is retried, since a requeued task would never be dispatched
+        """
+        if self._stopping or error_type in ('DependencyError', 'CancelledError'):
+            return False
+        options = self._options.get(name, {})
+        retries = options.get('retries', 0)
+        attempts = self._attempts.get(name, 1)
+        if not retries or attempts > retries:
+            return False
+        delay = options.get('backoff', 0) * 2 ** (attempts - 1)
+        logger.warning(f'{name} failed on attempt {attempts}; retrying in {delay:.2f}s')
+        self._timer_sequence += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_sequence, name))
+        self._waiting.add(name)
+        return True
+
+    def _fire_timers(self, logger):
+        """ queue the tasks whose retry delay has passed and dispatch what fits
+        """
+        now = time.monotonic()
+        fired = False
+        while self._timers and self._timers[0][0] <= now:
+            _, _, name = heapq.heappop(self._timers)
+            if name in self._waiting:
+                self._waiting.discard(name)
+                self._cursor.requeue(name)
+                fired = True
+        if fired:
+            self._maybe_schedule_next(logger)
+
+    def _next_wakeup(self):
+        """ return how long the scheduler thread may wait for an event before a retry
+            timer is due
+        """
+        if not self._timers:
+            return IDLE_WAKEUP
+        return min(IDLE_WAKEUP, max(0, self._timers[0][0] - time.monotonic()))
+
+    def _demand(self, name):
+        """ return the capacity units a task holds while it runs: a slot of its executor
+            and the tokens of the resources it declares
+        """
+        options = self._options.get(name, {})
+        demand = {('executor', self._executor_of(name)): options.get('slots', 1)}
+        for resource, amount in options.get('resources', {}).items():
+            demand[('resource', resource)] = amount
+        # a mutual-exclusion group is a resource with a single token
+        for group in _exclusive_groups(options.get('exclusive')):
+            demand[('exclusive', group)] = 1
+        return demand
+
+    def _check_demands(self):
+        """ raise ValueError for tasks that could never be dispatched because they claim
+            unknown resources or more tokens or slots than exist
+        """
+        errors = []
+        for name, demand in self._demands.items():
+            for (kind, key), amount in demand.items():
+                if kind == 'executor' and amount > self._pool_sizes[key]:
+                    errors.append(f'{name} needs {amount} {key} slots but there are only '
+                                  f'{self._pool_sizes[key]}')
+                if kind != 'resource':
+                    continue
+                if key not in self._resources:
+                    errors.append(f'{name} claims unknown resource {key!r}')
+                elif amount > self._resources[key]:
+                    errors.append(f'{name} claims {amount} {key!r} tokens but there are only '
+                                  f'{self._resources[key]}')
+        if errors:
+            raise ValueError('; '.join(errors))
+
+    def _admit(self, name):
+        """ claim the capacity a ready task needs; return None when it may be dispatched,
+            otherwise the capacity key it has to wait for
+        """
+        if self._up_to_date.get(name) or name in self._cache_hits:
+            # nothing to run, so nothing to claim
+            return None
+        lookup = self._look_up(name)
+        if lookup is not None:
+            return lookup
+        demand = self._demands[name]
+        blocker = self._capacity.blocker(demand)
+        if blocker is not None:
+            amount = demand[blocker]
+            if amount > 1 and blocker not in self._reservations:
+                # first multi-unit task to wait on this key: hold back units for it so a
+                # stream of smaller tasks cannot starve it
+                self._reservations[blocker] = (name, amount)
+            return blocker
+        blocker = self._reservation_blocker(name, demand)
+        if blocker is not None:
+            # wait apart from the tasks waiting for units of the key, so those (and the
+            # reserving task among them) are still reconsidered when units come back
+            return ('reserved', blocker)
+        self._capacity.claim(demand)
+        self._claims[name] = demand
+        self._dispatched_at[name] = time.monotonic()
+        for key in demand:
+            if self._reservations.get(key, (None,))[0] == name:
+                del self._reservations[key]
+                # what the reserved units were held back from may fit now
+                self._cursor.release(('reserved', key))
+                self._cursor.release(key)
+        return None
+
+    def _look_up(self, name):
+        """ start checking, once per run, whether a ready task has to run at all: whether
+            its outputs are up to date and whether its result is in the result cache
+
+            the checks run on the lookup thread; return the key the task waits on until
+            they are done, or None when there is nothing to check
+        """
+        if name in self._looked_up:
+            return None
+        self._looked_up.add(name)
+        options = self._options[name]
+        check_outputs = bool(options.get('outputs')) and all(
+            self._up_to_date.get(parent) for parent in self._plan.parents_of(name))
+        check_cache = bool(
+            self._result_cache and self._store_results and options.get('cache'))
+        if not check_outputs and not check_cache:
+            return None
+        self._lookup_pool.submit(self._check, name, check_outputs, check_cache)
+        return ('lookup', name)
+
+    def _check(self, name, check_outputs, check_cache):
+        """ on the lookup thread: run the checks _look_up() started and queue a 'checked'
+            event with (name, up to date, cache hit)
+        """
+        fresh = hit = False
+        try:
+            fresh = check_outputs and self._check_up_to_date(name)
+            hit = not fresh and check_cache and self._load_cached(name)
+        except Exception:
+            logging.getLogger(threading.current_thread().name).debug(
+                f'checking {name} failed', exc_info=True)
+        finally:
+            self._events.put(('checked', (name, fresh, hit)))
+
+    def _handle_checked(self, payload, logger):
+        """ process the outcome of the checks of a task: an up-to-date task or a cache hit
+            is done without running, anything else is dispatched once there is capacity
+        """
+        name, fresh, hit = payload
+        self._up_to_date[name] = fresh
+        if hit:
+            self._cache_hits.add(name)
+        self._cursor.release(('lookup', name))
+        self._maybe_schedule_next(logger)
+        self._check_completed(logger)
+
+    def _check_up_to_date(self, name):
+        """ return True if a task whose dependencies were up to date does not need to run:
+            its outputs are up to date with its inputs
+
+            while results are stored the task's last result, kept in its build record, is
+            put in state['results']; a task without a recorded result (or without build
+            records, i.e. no cache_dir) is run so dependents can read its result
         """
-        # determine number of free worker slots
-        free = max(0, self._workers - len(self._active))
-        if not free:
+        options = self._options[name]
+        record = None
+        if self._build_records:
+            record = self._build_records.load(task_key(name, self._callables[name][0]))
+        fresh = is_up_to_date(options.get('inputs', ()), options['outputs'],
+                              self._file_stats, record and record['inputs'])
+        if fresh and self._store_results:
+            fresh = record is not None and 'result' in record
+            if fresh:
+                with self.state_lock:
+                    self.state['results'][name] = record['result']
+        return fresh
+
+    def _record_build(self, name, result):
+        """ on the worker that ran it: note that a passed task rewrote its outputs and
+            record the inputs they were built from, along with its result
+        """
+        options = self._options.get(name, {})
+        self._file_stats.forget(options['outputs'])
+        if not self._build_records:
+            return
+        digests = input_digests(options.get('inputs', ()), self._file_stats)
+        if digests is None:
+            logging.getLogger(threading.current_thread().name).debug(
+                f'inputs of {name} are missing; build not recorded')
             return
+        self._build_records.save(
+            task_key(name, self._callables[name][0]), digests, result, self._store_results)
+
+    def _cache_key(self, name):
+        """ return the result cache key of a task from its name, its source and bound
+            values (see function_digest()), the keys (or result digests) of its dependencies
+            and the state values it declares as cache_inputs; None when any of them cannot
+            be hashed or a dependency did not succeed
+        """
+        function, with_state = self._callables[name]
+        digest = self._source_digests.get(function)
+        if digest is None:
+            digest = self._source_digests[function] = function_digest(function)
+        if digest is None:
+            return None
+        upstream = {}
+        for parent in self._plan.original_parents_of(name):
+            outcome = self._results.get(parent)
+            if not outcome or not outcome['ok']:
+                return None
+            upstream[parent] = (self._cache_keys.get(parent)
+                                or self._result_digests.get(parent)
+                                or value_digest(self._stored_result(parent)))
+            if upstream[parent] is None:
+                return None
+        inputs = {}
+        for key in self._options[name].get('cache_inputs', ()):
+            with self.state_lock:
+                value = self.state.get(key)
+            inputs[key] = value_digest(value)
+            if inputs[key] is None:
+                return None
+        return result_key({
+            'name': name, 'source': digest, 'with_state': with_state, 'upstream': upstream,
+            'inputs': inputs})
+
+    def _stored_result(self, name):
+        """ return the result of a task in state['results'], or None
+        """
+        with self.state_lock:
+            return self.state['results'].get(name)
+
+    def _load_cached(self, name):
+        """ on the lookup thread: compute the cache key of a task and store its cached
+            result on a hit; return True on a hit
+        """
+        key = self._cache_keys[name] = self._cache_key(name)
+        if key is None:
+            return False
+        try:
+            result = self._result_cache.load(key)
+        except KeyError:
+            return False
+        with self.state_lock:
+            self.state['results'][name] = result
+        return True
 
-        # get ready candidates
-        cands = self._graph.get_candidates(self._active, free)
-        if not self._skip_dependents:
-            # no skipping of dependents; submit all candidates
-            for cand in cands:
-                self._submit(cand)
+    def _cache_result(self, name, result):
+        """ on the worker that produced it: digest a result for the cache keys of its
+            dependents and store it in the result cache if the task is marked cache=True
+        """
+        key = self._cache_keys.get(name)
+        if key is None:
+            if name in self._digest_for:
+                self._result_digests[name] = value_digest(result)
             return
+        if not self._result_cache.save(key, result):
+            logging.getLogger(threading.current_thread().name).debug(
+                f'result of {name} could not be cached')
 
-        # skipping of dependents enabled; check for failed dependencies
-        failed_or_skipped = set(self._failed) | set(self._skipped)
-        for cand in cands:
-            deps = self._graph.original_parents_of(cand)
-            failed_deps = failed_or_skipped & set(deps)
-            if failed_deps:
-                # skip this candidate due to failed dependencies
-                logger.debug(f'{cand} skipped due to failed dependencies: {failed_deps}')
-                error = f'skipped due to failed dependency: {failed_deps}'
-                # add to active to avoid re-selection
-                self._active.add(cand)
-                self._events.put(('done', (cand, '', False, 'DependencyError', error)))
-            else:
-                self._submit(cand)
+    def _reservation_blocker(self, name, demand):
+        """ return a key whose units reserved for another task this demand would eat into,
+            unless the task can be backfilled: expected to be done before the reserving
+            task could start anyway
+
+            a task that holds a reservation of its own is never blocked by another one;
+            two reserving tasks waiting on each other's units would wait forever
+        """
+        if any(owner == name for owner, _ in self._reservations.values()):
+            return None
+        for key, amount in demand.items():
+            owner, reserved = self._reservations.get(key, (name, 0))
+            if owner == name:
+                continue
+            if self._capacity.used(key) + amount + reserved <= self._capacity.limit(key):
+                continue
+            if not self._fits_before(name, key, reserved):
+                return key
+        return None
+
+    def _fits_before(self, name, key, reserved):
+        """ return True if name is expected to finish before enough units of key free up
+            for a reservation of `reserved` units; False when durations are unknown
+        """
+        estimate = self._estimates.get(name)
+        if estimate is None:
+            return False
+        now = time.monotonic()
+        ends = []
+        for running, demand in self._claims.items():
+            if key not in demand:
+                continue
+            expected = self._estimates.get(running)
+            if expected is None:
+                return False
+            ends.append((self._dispatched_at[running] + expected, demand[key]))
+        free = self._capacity.limit(key) - self._capacity.used(key)
+        for end, amount in sorted(ends):
+            free += amount
+            if free >= reserved:
+                return now + estimate <= end
+        return False
+
+    def _release(self, name):
+        """ give back the capacity held by a finished task
+        """
+        demand = self._claims.pop(name, None)
+        self._dispatched_at.pop(name, None)
+        if demand is None:
+            return
+        self._capacity.release(demand)
+        for key in demand:
+            self._cursor.release(key)
+
+    def _maybe_schedule_next(self, logger):
+        """ schedule next ready tasks for which there is free capacity
+        """
+        if self._stopping:
+            return
+        # dependents of failed tasks were already skipped, so every candidate can run;
+        # tasks whose result was cached are done on the spot and may make others ready
+        while True:
+            cached = []
+            for cand in self._cursor.get_candidates(self._active, admit=self._admit):
+                if cand in self._cache_hits or self._up_to_date.get(cand):
+                    cached.append(cand)
+                else:
+                    self._submit(cand)
+            if not cached:
+                return
+            for name in cached:
+                self._finish(name, '', True, '', '', logger)
+
+    def _skip_dependents_of(self, name, logger):
+        """ record every dependent of a failed or skipped task as skipped in one step and
+            return their names in topological order
+        """
+        skipped = self._cursor.prune(name)
+        if not skipped:
+            return skipped
+        logger.debug(f'skipping {len(skipped)} dependents of {name!r}')
+        # a dependent's failed dependencies are the task itself or other skipped dependents
+        unsuccessful = {name, *skipped}
+        for dependent in skipped:
+            failed_deps = unsuccessful.intersection(self._plan.parents_of(dependent))
+            self._ran.append(dependent)
+            self._results[dependent] = {
+                'ok': False,
+                'error_type': 'DependencyError',
+                'error': f'skipped due to failed dependency: {failed_deps}'
+            }
+        self._skipped.extend(skipped)
+        return skipped
 
     def _handle_done(self, payload, logger):
         """ process a completed task, record its result, and schedule next tasks
@@ -146,7 +636,26 @@ class Scheduler:
         name, thread_name, ok, error_type, error = payload
         logger.debug(f'removing {name!r} from active futures')
         self._active.discard(name)
-        self._graph.remove(name)
+        self._release(name)
+        if not ok and self._maybe_retry(name, error_type, logger):
+            # the freed slot goes to other ready tasks while this one waits
+            self._maybe_schedule_next(logger)
+            return
+        self._finish(name, thread_name, ok, error_type, error, logger)
+        self._maybe_schedule_next(logger)
+        self._check_completed(logger)
+
+    def _check_completed(self, logger):
+        """ signal completion once nothing is left to run and nothing is running; once
+            cancelled, tasks never dispatched are dropped
+        """
+        if (self._cursor.is_empty() or self._stopping) and not self._active:
+            logger.debug('nothing more to run and no active futures remain - signaling all done')
+            self._completed.set()
+
+    def _finish(self, name, thread_name, ok, error_type, error, logger):
+        """ record the final outcome of a task, mark it done in the plan and fire callbacks
+        """
         self._ran.append(name)
         self._results[name] = {
             'ok': ok,
@@ -160,26 +669,86 @@ class Scheduler:
             else:
                 self._failed.append(name)
                 status = TaskStatus.FAILED
+        elif self._up_to_date.get(name):
+            logger.debug(f'{name} is up to date')
+            status = TaskStatus.UP_TO_DATE
+        elif name in self._cache_hits:
+            logger.debug(f'{name} result loaded from cache')
+            self._cached.append(name)
+            status = TaskStatus.CACHED
         else:
             status = TaskStatus.PASSED
+        skipped = self._skip_dependents_of(name, logger) if not ok and self._skip_dependents else ()
+        self._cursor.remove(name)
+
+        if self._journal:
+            self._write_journal(name, status, skipped)
+        if self._consumers:
+            for done in (name, *skipped):
+                self._release_inputs(done, logger)
+
+        count = len(self._ran) - len(skipped)
+        self._callback(self._on_task_done, name, thread_name, status, count)
+        for count, dependent in enumerate(skipped, count + 1):
+            self._callback(self._on_task_done, dependent, '', TaskStatus.SKIPPED, count)
+        if (status is TaskStatus.FAILED and self._max_failures and not self._stopping
+                and len(self._failed) >= self._max_failures):
+            logger.error(
+                f'failure limit of {self._max_failures} reached; cancelling remaining tasks')
+            self._cancel(logger)
+
+    def _release_inputs(self, name, logger):
+        """ count a done task off the consumers of its dependencies' results and drop the
+            results nothing is waiting for anymore
+
+            the task's own result goes too if its dependents were all skipped before it
+            finished; results of leaf tasks and tasks marked keep_result are kept
+        """
+        released = [parent for parent in self._plan.original_parents_of(name)
+                    if self._consume(parent) and parent in self._results]
+        if self._consumers.get(name) == 0:
+            released.append(name)
+        released = [task for task in released
+                    if not self._options.get(task, {}).get('keep_result')]
+        if not released:
+            return
+        logger.debug(f'releasing results of {released}')
+        with self.state_lock:
+            for task in released:
+                self.state['results'].pop(task, None)
 
-        self._callback(self._on_task_done, name, thread_name, status, len(self._ran))
-        self._maybe_schedule_next(logger)
-
-        # check for overall completion
-        if self._graph.is_empty() and not self._active:
-            logger.debug('nothing more to run and no active futures remain - signaling all done')
-            self._completed.set()
+    def _consume(self, name):
+        """ count one consumer of a task's result off; return True when it was the last
+        """
+        self._consumers[name] -= 1
+        return not self._consumers[name]
 
-    def _handle_event(self):
+    def _write_journal(self, name, status, skipped):
+        """ append the outcome of a finished task and of the dependents skipped with it
+            to the journal
+        """
+        with self.state_lock:
+            results = self.state.get('results', {})
+            has_result = status is not TaskStatus.FAILED and name in results
+            result = results.get(name) if has_result else None
+        # serialized and written on the journal's thread, so dispatching never waits on it
+        self._journal.append(name, status.value, result, has_result)
+        for dependent in skipped:
+            self._journal.append(dependent, TaskStatus.SKIPPED.value)
+
+    def _handle_event(self, block=False, timeout=None):
         """ process queued task and scheduler events on the scheduler thread
+
+            when block is True wait up to timeout for the first event to arrive,
+            then drain whatever else is already queued without waiting
         """
         logger = logging.getLogger(threading.current_thread().name)
         while True:
             try:
-                kind, payload = self._events.get_nowait()
+                kind, payload = self._events.get(block=block, timeout=timeout)
             except queue.Empty:
                 break
+            block = False
 
             if kind == 'start':
                 name = payload
@@ -192,11 +761,18 @@ class Scheduler:
             elif kind == 'done':
                 self._handle_done(payload, logger)
 
+            elif kind == 'checked':
+                self._handle_checked(payload, logger)
+
     def _build_summary(self):
         """ assemble concise run summary from collected results and timings
         """
         ran = list(self._ran)
-        passed = [name for name, result in self._results.items() if result["ok"]]
+        cached = list(self._cached)
+        up_to_date = [name for name in ran if self._up_to_date.get(name)]
+        passed = [name for name, result in self._results.items()
+                  if result["ok"] and name not in self._cache_hits
+                  and not self._up_to_date.get(name)]
         failed = list(self._failed)
         skipped = list(self._skipped)
         failures = {
@@ -213,8 +789,12 @@ class Scheduler:
             'passed': passed,
             'failed': failed,
             'skipped': self._skipped,
+            'cached': cached,
+            'up_to_date': up_to_date,
             'failures': failures,
             'failure_counts': dict(failure_counts),
+            'durations': dict(self._durations),
+            'attempts': dict(self._attempts),
             'started_at': self._timer.started_at,
             'finished_at': self._timer.finished_at,
             'duration': self._timer.duration,
@@ -222,17 +802,22 @@ class Scheduler:
         lp = len(passed)
         lf = len(failed)
         ls = len(skipped)
-        text = f"==== {lp} passed, {lf} failed, {ls} skipped in {summary['duration']:.2f}s ===="
+        lc = f', {len(cached)} cached' if cached else ''
+        if up_to_date:
+            lc += f', {len(up_to_date)} up to date'
+        text = f"==== {lp} passed, {lf} failed, {ls} skipped{lc} in {summary['duration']:.2f}s ===="
         if HAS_COLOR:
             summary['text'] = f'{Style.BRIGHT + Fore.BLUE + text + Style.RESET_ALL}'
         else:
             summary['text'] = text
         return summary
 
-    def _handle_interrupt(self, logger):
-        """ cancel in-flight work, drain events, and mark remaining tasks as cancelled
+    def _cancel(self, logger):
+        """ stop dispatching, cancel futures that have not started, drop pending retries
+            and signal running tasks through state['_cancel']
         """
-        logger.error('interrupt received; cancelling remaining tasks')
+        self._stopping = True
+        self.cancel_event.set()
 
         # cancel all futures we still track
         with self._lock:
@@ -243,15 +828,18 @@ class Scheduler:
             except (CancelledError, RuntimeError) as exception:
                 logger.debug(f'cancel() ignored for completed future: {exception}')
 
-        # drain anything already completed and queued
-        self._handle_event()
+        # tasks waiting for a retry never emit another 'done' event
+        waiting = sorted(self._waiting)
+        self._waiting.clear()
+        self._timers.clear()
+        self._record_cancelled(waiting)
 
-        # mark any still-active tasks as cancelled (these never emitted a 'done' event)
-        still_active = list(self._active)
-        self._active.clear()
-        for name in still_active:
-            # remove from graph so completion logic won't wait on them
-            self._graph.remove(name)
+    def _record_cancelled(self, names):
+        """ record tasks that were cut short as failed with a CancelledError
+        """
+        for name in names:
+            # remove from plan so completion logic won't wait on them
+            self._cursor.remove(name)
             # record cancellation
             self._ran.append(name)
             self._results[name] = {
@@ -261,6 +849,20 @@ class Scheduler:
             }
             self._failed.append(name)
 
+    def _handle_interrupt(self, logger):
+        """ cancel in-flight work, drain events, and mark remaining tasks as cancelled
+        """
+        logger.error('interrupt received; cancelling remaining tasks')
+        self._cancel(logger)
+
+        # drain anything already completed and queued
+        self._handle_event()
+
+        # mark any still-active tasks as cancelled (these never emitted a 'done' event)
+        still_active = list(self._active)
+        self._active.clear()
+        self._record_cancelled(still_active)
+
         # signal completion so the loop (if resumed) would exit
         self._completed.set()
 
@@ -272,7 +874,24 @@ class Scheduler:
         self._results.clear()
         self._failed.clear()
         self._skipped.clear()
+        self._cached.clear()
+        self._cache_keys.clear()
+        self._cache_hits.clear()
+        self._looked_up.clear()
+        self._source_digests.clear()
+        self._result_digests.clear()
+        self._up_to_date.clear()
+        self._file_stats = FileStats()
+        self._durations.clear()
+        self._claims.clear()
+        self._reservations.clear()
+        self._dispatched_at.clear()
+        self._attempts.clear()
+        self._timers.clear()
+        self._waiting.clear()
         self._completed.clear()
+        self._stopping = False
+        self.cancel_event.clear()
         self._futures.clear()
         self._active.clear()
         # clear stored results
@@ -285,6 +904,75 @@ class Scheduler:
                 self._events.get_nowait()
         except queue.Empty:
             pass
+        # compile once; every later run only needs a fresh cursor
+        if self._plan is None:
+            self._plan = self._compile()
+        elif self._history and self._policy == 'critical_path':
+            # durations recorded by earlier runs reweight the ranks of the same plan
+            self._plan = self._plan.reranked(self._ranks())
+        self._cursor = self._plan.cursor()
+        limits = {('executor', kind): size for kind, size in self._pool_sizes.items()}
+        limits.update({('resource', key): count for key, count in self._resources.items()})
+        self._demands = {name: self._demand(name) for name in self._callables}
+        # every mutual-exclusion group in use has a single token
+        limits.update({key: 1 for demand in self._demands.values() for key in demand
+                       if key[0] == 'exclusive'})
+        self._capacity = Capacity(limits)
+        self._check_demands()
+        self._consumers = {}
+        if self._release_results and self._store_results:
+            for name in self._plan.nodes():
+                for parent in self._plan.original_parents_of(name):
+                    self._consumers[parent] = self._consumers.get(parent, 0) + 1
+        self._digest_for = set()
+        if self._result_cache and self._store_results:
+            for name in self._plan.nodes():
+                if self._options.get(name, {}).get('cache'):
+                    self._digest_for.update(self._plan.original_parents_of(name))
+        self._estimates = {}
+        if self._history:
+            for name, key in self._task_keys().items():
+                duration = self._history.get(key)
+                if duration is not None:
+                    self._estimates[name] = duration
+
+    def _compile(self):
+        """ compile the graph into an execution plan ranked the way the policy dictates
+            'alphabetical' needs no ranks; 'critical_path' dispatches the ready tasks with the
+            longest chain of dependents below them first, with each task weighted by its
+            recorded duration when a timing history is available
+        """
+        return self._graph.compile(self._ranks(), reduce=self._reduce_edges)
+
+    def _ranks(self):
+        """ return the dispatch ranks the policy dictates, or None for 'alphabetical'
+        """
+        if self._policy != 'critical_path':
+            return None
+        weights = None
+        if self._history:
+            weights = self._history.weights(self._task_keys())
+        return self._graph.upward_ranks(weights)
+
+    def _task_keys(self):
+        """ return {name: history key} for every registered task
+        """
+        return {name: task_key(name, function)
+                for name, (function, _) in self._callables.items()}
+
+    def _save_history(self, logger):
+        """ record the durations of tasks that passed and persist the timing history
+        """
+        if not self._history:
+            return
+        keys = self._task_keys()
+        for name in self._ran:
+            if self._results[name]['ok'] and name in self._durations:
+                self._history.record(keys[name], self._durations[name])
+        try:
+            self._history.save()
+        except OSError as exception:
+            logger.warning(f'unable to save timing history: {exception}')
 
     def start(self):
         """ run all registered tasks respecting dependencies, collect results, and trigger callbacks
@@ -297,22 +985,27 @@ class Scheduler:
         meta = {
             'total_tasks': len(self._callables),
             'workers': self._workers,
+            'executor': self._executor_kind,
+            'pools': {kind: self._pool_sizes[kind] for kind in self._executors_in_use()},
             'start_time': self._timer.started_at
         }
         self._callback(self._on_scheduler_start, meta)
+        if self._journal:
+            self._journal.open()
 
         try:
-            with ThreadPoolExecutor(max_workers=self._workers,
-                                    thread_name_prefix=self._prefix) as executor:
-                self._executor = executor
-                logger.info(f'starting thread pool with {self._workers} threads')
+            with self._open_executors() as executors:
+                self._executors = executors
                 # initial seeding
-                for name in self._graph.get_candidates(self._active, self._workers):
-                    self._submit(name)
+                self._maybe_schedule_next(logger)
+                if self._cursor.is_empty():
+                    self._completed.set()
 
-                # main loop of scheduler thread
-                while not self._completed.wait(timeout=0.1):
-                    self._handle_event()
+                # main loop of scheduler thread; sleep on the event queue itself so
+                # dependents are dispatched the moment a 'done' event arrives
+                while not self._completed.is_set():
+                    self._handle_event(block=True, timeout=self._next_wakeup())
+                    self._fire_timers(logger)
 
                 # final drain
                 self._handle_event()
@@ -324,22 +1017,106 @@ class Scheduler:
         finally:
             self._timer.stop()
             logger.debug(f'duration: {self._timer.duration:.2f}s')
+            if self._journal:
+                self._journal.close()
+            self._save_history(logger)
 
             # build and return summary
             summary = self._build_summary()
             self._callback(self._on_scheduler_done, summary)
             return summary
 
+    def _executors_in_use(self):
+        """ return the executors registered tasks run on, the default one first
+        """
+        kinds = {self._executor_kind: None}
+        kinds.update(dict.fromkeys(self._executor_of(name) for name in self._callables))
+        return list(kinds)
+
+    @contextmanager
+    def _open_executors(self):
+        """ provide executor → executor instance for the executors used in one run
+
+            threads are named after _pool_prefix(). under the 'process' executor each task
+            still goes through a pool thread, which hands the callable to a worker process
+            and waits for its return value
+        """
+        logger = logging.getLogger(threading.current_thread().name)
+        executors = {}
+        with ExitStack() as stack:
+            for kind in self._executors_in_use():
+                size = self._pool_sizes[kind]
+                prefix = self._pool_prefix(kind)
+                if kind == 'async':
+                    logger.info(f'starting event loop with {size} concurrent tasks')
+                    executors[kind] = stack.enter_context(
+                        AsyncLoopExecutor(thread_name=f'{prefix}_0'))
+                    continue
+                if kind == 'process':
+                    logger.info(f'starting process pool with {size} processes')
+                    self._process_modules = self._task_modules()
+                    self._process_pool = stack.enter_context(ProcessPoolExecutor(
+                        max_workers=size,
+                        initializer=_prepare_process,
+                        initargs=(self._process_modules,)))
+                    stack.callback(setattr, self, '_process_pool', None)
+                else:
+                    logger.info(f'starting thread pool with {size} threads')
+                executors[kind] = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=size, thread_name_prefix=prefix))
+            if any(options.get('outputs') or options.get('cache') and self._result_cache
+                   and self._store_results for options in self._options.values()):
+                self._lookup_pool = stack.enter_context(
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix='lookup'))
+                stack.callback(setattr, self, '_lookup_pool', None)
+            yield executors
+
+    def _pool_prefix(self, kind):
+        """ return the thread name prefix of an executor's pool: the scheduler prefix for the
+            default executor and otherwise the executor's name, or '{name}_pool' where that
+            is the scheduler prefix too, so no two pools share thread names
+        """
+        if kind == self._executor_kind:
+            return self._prefix
+        return kind if kind != self._prefix else f'{kind}_pool'
+
+    def _task_modules(self):
+        """ return module name → file path for the modules task callables are defined in
+        """
+        modules = {}
+        for function, _ in self._callables.values():
+            module = sys.modules.get(getattr(function, '__module__', None))
+            path = getattr(module, '__file__', None)
+            if path:
+                modules[module.__name__] = path
+        return modules
+
+    def _process_state(self, name):
+        """ return the read-only copy of state shipped to a worker process: results are
+            limited to those of the task's declared dependencies
+        """
+        with self.state_lock:
+            snapshot = {k: v for k, v in self.state.items()
+                        if k not in ('_state_lock', '_cancel')}
+            results = snapshot.get('results')
+            if isinstance(results, dict):
+                parents = self.plan.original_parents_of(name)
+                snapshot['results'] = {p: results[p] for p in parents if p in results}
+        return snapshot
+
     def _submit(self, name):
-        """ submit a ready task to the thread pool and queue its start event
+        """ submit a ready task to the executor and queue its start event
         """
         logger = logging.getLogger(threading.current_thread().name)
-        logger.debug(f'submitting {name!r} to thread pool')
+        kind = self._executor_of(name)
+        logger.debug(f'submitting {name!r} to {kind} executor')
 
         # queue 'start' event
         self._events.put(('start', name))
+        self._attempts[name] = self._attempts.get(name, 0) + 1
 
-        future = self._executor.submit(self._run, name)
+        run = self._arun if kind == 'async' else self._run
+        future = self._executors[kind].submit(run, name)
         logger.debug(f'adding {name} to active futures')
         self._active.add(name)
         with self._lock:
@@ -356,7 +1133,7 @@ class Scheduler:
         except Exception as exception:
             # worker failed before building payload - recover name and emit synthetic failure
             name = self._futures.get(future, '<unknown>')
-            payload = (name, False, type(exception).__name__, str(exception))
+            payload = (name, '', False, type(exception).__name__, str(exception))
         finally:
             # cleanup no matter what
             with self._lock:
@@ -365,30 +1142,108 @@ class Scheduler:
         # queue 'done' event
         self._events.put(('done', payload))
 
-    def _run(self, name):
-        """ execute a task callable, capture errors, and return its result tuple
+    def _begin_run(self, name):
+        """ queue the 'run' event for a task and return the name of the thread running it
         """
         thread_name = threading.current_thread().name
-        logger = logging.getLogger(thread_name)
-
         # queue 'run' event
         payload = (name, thread_name)
         self._events.put(('run', payload))
+        logging.getLogger(thread_name).debug(f'run {name!r}')
+        return thread_name
+
+    def _end_run(self, name, result, started):
+        """ record the duration and result of a task that returned normally
+        """
+        self._durations[name] = time.perf_counter() - started
+        if self._store_results:
+            with self.state_lock:
+                self.state['results'][name] = result
 
-        logger.debug(f'run {name!r}')
+    def _persists(self, name):
+        """ return True if the worker that ran a task has to record its build or cache or
+            digest its result
+        """
+        return (bool(self._options.get(name, {}).get('outputs'))
+                or self._cache_keys.get(name) is not None or name in self._digest_for)
+
+    def _persist(self, name, result):
+        """ on the worker that ran a task that passed: record its build and cache or digest
+            its result
+        """
+        if self._options.get(name, {}).get('outputs'):
+            self._record_build(name, result)
+        self._cache_result(name, result)
+
+    def _run(self, name):
+        """ execute a task callable, capture errors, and return its result tuple
+        """
+        thread_name = self._begin_run(name)
+        logger = logging.getLogger(thread_name)
         ok = False
         error_type = None
         error = None
         try:
             function, with_state = self._callables[name]
-            if with_state:
-                result = function(self.state)
+            timeout = self._timeout_of(name)
+            started = time.perf_counter()
+            if self._executor_of(name) == 'process':
+                state = self._process_state(name) if with_state else None
+                if timeout is None:
+                    future = self._process_pool.submit(_call_in_process, function, state)
+                    result = future.result()
+                else:
+                    # a pool worker cannot be stopped on its own; use a process that can
+                    result = _call_in_new_process(
+                        function, state, timeout, self._process_modules)
+            elif timeout is None:
+                result = _call(function, (self.state,) if with_state else ())
             else:
-                result = function()
+                result = _call_in_new_thread(function, (self.state,) if with_state else (),
+                                             timeout)
+            self._end_run(name, result, started)
+            if self._persists(name):
+                self._persist(name, result)
+            ok = True
+        except Exception as exception:
+            error_type = type(exception).__name__
+            error = str(exception)
+            logger.error(f'{function.__name__}: {error_type}: {error}')
+        return (name, thread_name, ok, error_type, error)
 
-            if self._store_results:
-                with self.state_lock:
-                    self.state['results'][name] = result
+    async def _arun(self, name):
+        """ coroutine counterpart of _run() used by the async executor; plain callables
+            are run in a thread so they never block the event loop
+        """
+        thread_name = self._begin_run(name)
+        logger = logging.getLogger(thread_name)
+        ok = False
+        error_type = None
+        error = None
+        try:
+            function, with_state = self._callables[name]
+            args = (self.state,) if with_state else ()
+            timeout = self._timeout_of(name)
+            started = time.perf_counter()
+            if inspect.iscoroutinefunction(function):
+                awaitable = function(*args)
+            elif timeout is None:
+                awaitable = asyncio.to_thread(function, *args)
+            else:
+                # a thread of the loop's default executor would be joined at exit
+                awaitable = _in_daemon_thread(function, args)
+            try:
+                result = await asyncio.wait_for(awaitable, timeout)
+            except asyncio.TimeoutError:
+                if timeout is None:
+                    raise
+                raise TimeoutError(f'timed out after {timeout}s') from None
+            if inspect.isawaitable(result):
+                result = await result
+            self._end_run(name, result, started)
+            if self._persists(name):
+                # hashing files or pickling a result would block every coroutine on the loop
+                await asyncio.to_thread(self._persist, name, result)
             ok = True
         except Exception as exception:
             error_type = type(exception).__name__
@@ -444,6 +1299,7 @@ class Scheduler:
         with self.state_lock:
             state_copy = dict(self.state)
         state_copy.pop('_state_lock', None)
+        state_copy.pop('_cancel', None)
         return state_copy
 
     @property
@@ -452,23 +1308,254 @@ class Scheduler:
         """
         return self._graph
 
+    @property
+    def plan(self):
+        """ return the compiled execution plan, compiling it if tasks changed since
+        """
+        if self._plan is None:
+            self._plan = self._compile()
+        return self._plan
+
     @property
     def sanitized_state(self):
         """ return a copy of the current state with the lock removed
         """
         return self.sanitize_state()
 
-def mark(*, after=None, with_state=True, tags=None):
+def _pool_sizes(workers, executor):
+    """ return executor → pool size from an int (the size of the default executor's pool)
+        or a mapping of executor → size; unspecified pools get their default size
+    """
+    sizes = {kind: default_async_workers if kind == 'async' else default_workers
+             for kind in EXECUTORS}
+    if isinstance(workers, Mapping):
+        unknown = sorted(set(workers) - set(EXECUTORS))
+        if unknown:
+            raise ValueError(f'workers given for unknown executors {unknown}; '
+                             f'executors are {EXECUTORS}')
+        sizes.update(workers)
+    elif workers:
+        sizes[executor] = workers
+    if any(not isinstance(size, int) or size < 1 for size in sizes.values()):
+        raise ValueError('workers must be positive integers')
+    return sizes
+
+def _check_options(options):
+    """ validate per-task options and return them without the ones left unset
+    """
+    unknown = sorted(set(options) - set(TASK_OPTIONS))
+    if unknown:
+        raise ValueError(f'unknown task options {unknown}; options are {TASK_OPTIONS}')
+    options = {key: value for key, value in options.items() if value is not None}
+    if options.get('executor', EXECUTORS[0]) not in EXECUTORS:
+        raise ValueError(f'executor must be one of {EXECUTORS}')
+    _check_timeout(options.get('timeout'))
+    retries = options.get('retries', 0)
+    if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+        raise ValueError('retries must be a non-negative integer')
+    backoff = options.get('backoff', 0)
+    if isinstance(backoff, bool) or not isinstance(backoff, (int, float)) or backoff < 0:
+        raise ValueError('backoff must be a non-negative number of seconds')
+    _check_counts('resources', options.get('resources'))
+    exclusive = options.get('exclusive')
+    if exclusive is not None and not (
+            isinstance(exclusive, str)
+            or isinstance(exclusive, (list, tuple)) and all(isinstance(g, str) for g in exclusive)):
+        raise ValueError('exclusive must be a group name or a list of group names')
+    slots = options.get('slots', 1)
+    if isinstance(slots, bool) or not isinstance(slots, int) or slots < 1:
+        raise ValueError('slots must be a positive integer')
+    if not isinstance(options.get('cache', False), bool):
+        raise ValueError('cache must be True or False')
+    cache_inputs = options.get('cache_inputs', ())
+    if not isinstance(cache_inputs, (list, tuple)) or not all(
+            isinstance(key, str) for key in cache_inputs):
+        raise ValueError('cache_inputs must be a list of state keys')
+    if not isinstance(options.get('keep_result', False), bool):
+        raise ValueError('keep_result must be True or False')
+    for key in ('inputs', 'outputs'):
+        paths = options.get(key, ())
+        if not isinstance(paths, (list, tuple)) or not all(isinstance(p, str) for p in paths):
+            raise ValueError(f'{key} must be a list of paths')
+    return options
+
+def _exclusive_groups(exclusive):
+    """ return the mutual-exclusion groups named by an exclusive option
+    """
+    if exclusive is None:
+        return []
+    return [exclusive] if isinstance(exclusive, str) else list(exclusive)
+
+def _check_counts(label, counts):
+    """ raise ValueError unless counts is None or a mapping of name → positive integer
+    """
+    if counts is None:
+        return
+    if not isinstance(counts, Mapping) or any(
+            not isinstance(count, int) or isinstance(count, bool) or count < 1
+            for count in counts.values()):
+        raise ValueError(f'{label} must map names to positive integers')
+
+def _check_timeout(timeout):
+    """ raise ValueError unless timeout is None or a positive number of seconds
+    """
+    if timeout is None:
+        return
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise ValueError('timeout must be a positive number of seconds')
+
+def _wrap(function):
+    """ return a transparent wrapper around function; coroutine functions get a coroutine
+        function wrapper so they are still recognized as such
+    """
+    if inspect.iscoroutinefunction(function):
+        @wraps(function)
+        async def wrapped(*args, **kwargs):
+            return await function(*args, **kwargs)
+    else:
+        @wraps(function)
+        def wrapped(*args, **kwargs):
+            return function(*args, **kwargs)
+    return wrapped
+
+async def _await(awaitable):
+    """ await any awaitable; lets asyncio.run() accept awaitables that are not coroutines
+    """
+    return await awaitable
+
+def _call(function, args):
+    """ call a task callable; a coroutine task gets an event loop of its own
+    """
+    result = function(*args)
+    if inspect.isawaitable(result):
+        result = asyncio.run(_await(result))
+    return result
+
+def _call_in_process(function, state):
+    """ call a task callable in a worker process; state is None for tasks without state
+        and otherwise a copy, so it gets a lock of its own (and a cancel event that is
+        never set; cancellation does not reach worker processes)
+    """
+    if state is None:
+        return _call(function, ())
+    state['_state_lock'] = threading.RLock()
+    state['_cancel'] = threading.Event()
+    return _call(function, (state,))
+
+def _call_in_new_thread(function, args, timeout):
+    """ call a task callable on a thread of its own and give up on it after timeout
+        seconds; the abandoned thread is a daemon, so it frees the pool thread (and never
+        holds up exit), and whatever it returns later is dropped
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = _call(function, args)
+        except BaseException as exception:
+            outcome['error'] = exception
+
+    # same name as the pool thread so the task logs where it always does
+    thread = threading.Thread(target=target, name=threading.current_thread().name, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f'timed out after {timeout}s')
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+def _in_daemon_thread(function, args):
+    """ return an asyncio future of a task callable called on a daemon thread of its own;
+        when the future is abandoned (e.g. on a timeout) the thread never holds up exit
+        and whatever it returns later is dropped
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if not future.done():
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def target():
+        try:
+            outcome = (_call(function, args), None)
+        except BaseException as exception:
+            outcome = (None, exception)
+        try:
+            loop.call_soon_threadsafe(settle, *outcome)
+        except RuntimeError:
+            # the loop was closed while the task ran on
+            pass
+
+    # same name as the loop thread so the task logs where it always does
+    threading.Thread(target=target, name=threading.current_thread().name, daemon=True).start()
+    return future
+
+def _call_in_new_process(function, state, timeout, modules):
+    """ call a task callable in a process of its own that is terminated after timeout
+        seconds
+    """
+    # pickle here so unpicklable tasks fail like they do in the pool
+    payload = pickle.dumps((function, state))
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_process_entry, args=(sender, modules, payload), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            process.terminate()
+            raise TimeoutError(f'timed out after {timeout}s')
+        try:
+            ok, value = receiver.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(f'worker process exited with code {process.exitcode}')
+    finally:
+        receiver.close()
+        process.join()
+    if not ok:
+        raise value
+    return value
+
+def _process_entry(sender, modules, payload):
+    """ entry point of a process started by _call_in_new_process()
+    """
+    _prepare_process(modules)
+    try:
+        function, state = pickle.loads(payload)
+        sender.send((True, _call_in_process(function, state)))
+    except Exception as exception:
+        try:
+            sender.send((False, exception))
+        except Exception:
+            sender.send((False, RuntimeError(f'{type(exception).__name__}: {exception}')))
+    finally:
+        sender.close()
+
+def _prepare_process(modules):
+    """ process pool initializer: load task modules that are not importable by name in a
+        freshly started worker so task callables can be unpickled
+    """
+    for name, path in modules.items():
+        if name not in sys.modules:
+            _load_module(path)
+
+def mark(*, after=None, with_state=True, tags=None, **options):
     """ mark a function for deferred registration by a Scheduler
         does NOT register anything; only attaches metadata for discovery
+        options are the per-task settings named in TASK_OPTIONS, e.g. executor='process'
     """
     deps = list(after) if after else []
+    options = _check_options(options)
 
     def decorator(function):
         # preserve wrapper metadata if function is further decorated later
-        @wraps(function)
-        def wrapped(*args, **kwargs):
-            return function(*args, **kwargs)
+        wrapped = _wrap(function)
 
         # attach metadata to the function object
         wrapped.__thread_order__ = {
@@ -476,22 +1563,23 @@ def mark(*, after=None, with_state=True, tags=None):
             'with_state': with_state,
             'orig_name': function.__name__,
             'tags': [] if tags is None else [t.strip() for t in tags.split(',') if t.strip()],
+            **options,
         }
         return wrapped
 
     return decorator
 
-def dmark(*, after=None, with_state=False, tags=None):
+def dmark(*, after=None, with_state=False, tags=None, **options):
     """ mark a function for deferred registration by a Scheduler
         does NOT register anything; only attaches metadata for discovery
+        options are the per-task settings named in TASK_OPTIONS, e.g. executor='process'
     """
     deps = list(after) if after else []
+    options = _check_options(options)
 
     def decorator(function):
         # preserve wrapper metadata if function is further decorated later
-        @wraps(function)
-        def wrapped(*args, **kwargs):
-            return function(*args, **kwargs)
+        wrapped = _wrap(function)
 
         # attach metadata to the function object
         wrapped.__thread_order__ = {
@@ -499,6 +1587,7 @@ def dmark(*, after=None, with_state=False, tags=None):
             'with_state': with_state,
             'orig_name': function.__name__,
             'tags': [] if tags is None else [t.strip() for t in tags.split(',') if t.strip()],
+            **options,
         }
         return wrapped
 
@@ -523,7 +1612,15 @@ def _load_module(path):
     if spec is None or spec.loader is None:
         raise ImportError(f"Could not load module from '{path}'")
     module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    # register under its name (unless that would shadow another module) so its functions
+    # can be pickled and sent to worker processes
+    sys.modules.setdefault(spec.name, module)
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        if sys.modules.get(spec.name) is module:
+            del sys.modules[spec.name]
+        raise
     return module
 
 def _get_functions(module, module_path):
@@ -538,29 +1635,80 @@ def _get_functions(module, module_path):
             if inspect.isfunction(function):
                 yield node.name, function, isinstance(node, ast.AsyncFunctionDef)
 
-def _collect_functions(module, module_path, tags_filter=None):
+def _matches_tags(meta, tags_filter):
+    """ return True if a function's metadata carries every tag in tags_filter
+    """
+    tags = meta.get('tags') or []
+    return not any(t not in tags for t in tags_filter or [])
+
+def _cache_entry(name, meta, is_async):
+    """ return the JSON-serializable discovery cache entry for a marked function
+    """
+    return {
+        'name': name,
+        'after': list(meta.get('after') or []),
+        'with_state': bool(meta.get('with_state')),
+        'tags': list(meta.get('tags') or []),
+        'is_async': is_async,
+    }
+
+def _collect_functions(module, module_path, tags_filter=None, cache=None):
     """ return (name, function, meta) for all functions marked by @mark.
+
+        with a discovery cache the marked functions are looked up by name when the
+        module is unchanged instead of parsing and walking its source again.
     """
+    entries = cache.load(module_path) if cache else None
+    if entries is not None:
+        discovered = [(e['name'], getattr(module, e['name'], None), e['is_async'])
+                      for e in entries]
+    else:
+        discovered = _get_functions(module, module_path)
     functions = []
-    for name, function, is_async in _get_functions(module, module_path):
+    marked = []
+    for name, function, is_async in discovered:
         meta = getattr(function, '__thread_order__', None)
         if meta is None:
             continue
-        if is_async:
-            raise SystemExit(f"Async @mark functions are not supported: '{name}'")
-        if tags_filter:
-            tags = meta.get('tags') or []
-            if any(t not in tags for t in tags_filter):
-                continue
+        marked.append(_cache_entry(name, meta, is_async))
+        if tags_filter and not _matches_tags(meta, tags_filter):
+            continue
         functions.append((name, function, meta))
+    if cache and entries is None:
+        cache.save(module_path, marked)
     return functions
 
-def load_and_collect_functions(target, tags_filter=None):
+def _select_upstream(functions, function_name):
+    """ return the functions needed to run function_name: itself and its transitive
+        dependencies, in their original order
+    """
+    names = {name for name, _, _ in functions}
+    graph = DAGraph.from_edges(
+        (name, [dep for dep in meta.get('after') or [] if dep in names])
+        for name, _, meta in functions)
+    needed = graph.ancestors_of(function_name)
+    needed.add(function_name)
+    return [f for f in functions if f[0] in needed]
+
+def load_and_collect_functions(target, tags_filter=None, with_upstream=False, cache=None,
+                               graph_only=False):
     """ load a module, collect @mark functions, and apply tag and name filtering
+
+        when a single function is targeted it runs on its own (single-function mode),
+        or together with its transitive dependencies when with_upstream is set.
+        with graph_only and an up-to-date discovery cache the module is not imported
+        at all; module and every function are then None and meta holds cached metadata.
     """
     module_path, function_name = _split_target(target)
-    module = _load_module(module_path)
-    marked_functions = _collect_functions(module, module_path, tags_filter=tags_filter)
+    entries = cache.load(module_path) if cache and graph_only else None
+    if entries is not None:
+        module = None
+        marked_functions = [(e['name'], None, e) for e in entries
+                            if _matches_tags(e, tags_filter)]
+    else:
+        module = _load_module(module_path)
+        marked_functions = _collect_functions(
+            module, module_path, tags_filter=tags_filter, cache=cache)
     if not marked_functions:
         raise SystemExit(
             f'No @mark functions found in {module_path} '
@@ -574,13 +1722,16 @@ def load_and_collect_functions(target, tags_filter=None):
                 f"function '{function_name}' not found or "
                 f"not marked with @mark in {module_path} or "
                 'does not match the given tags filter')
-        marked_functions = filtered
-        single_function_mode = True
+        if with_upstream:
+            marked_functions = _select_upstream(marked_functions, function_name)
+        else:
+            marked_functions = filtered
+            single_function_mode = True
 
     return module, marked_functions, single_function_mode
 
-def register_functions(scheduler, functions, tags_filter, single_function_mode):
-    """ register collected functions with the scheduler
+def _prune_dependencies(functions, tags_filter, single_function_mode):
+    """ yield (name, function, meta, after) for collected functions
 
         handles dependency stripping for single-function mode and
         dependency pruning when tag filtering is active.
@@ -588,7 +1739,6 @@ def register_functions(scheduler, functions, tags_filter, single_function_mode):
     allowed_names = ({name for name, _, _ in functions} if tags_filter else None)
     for name, function, meta in functions:
         after = meta.get('after') or None
-        with_state = bool(meta.get('with_state'))
         # break dependency edges when running a single function
         if single_function_mode and after:
             after = []
@@ -596,4 +1746,23 @@ def register_functions(scheduler, functions, tags_filter, single_function_mode):
         if after and allowed_names is not None:
             # exclude dependencies that are missing due to tag filtering
             after = [d for d in after if d in allowed_names]
-        scheduler.register(function, name=name, after=after, with_state=with_state)
+        yield name, function, meta, after
+
+def register_functions(scheduler, functions, tags_filter, single_function_mode):
+    """ register collected functions with the scheduler in one bulk load
+
+        functions may be declared in any order in the module.
+    """
+    tasks = []
+    for name, function, meta, after in _prune_dependencies(
+            functions, tags_filter, single_function_mode):
+        options = {key: meta[key] for key in TASK_OPTIONS if key in meta}
+        tasks.append((name, (function, after, bool(meta.get('with_state')), options)))
+    scheduler.register_many(tasks)
+
+def build_graph(functions, tags_filter, single_function_mode):
+    """ return the DAGraph register_functions() would build, without a scheduler
+    """
+    return DAGraph.from_edges(
+        (name, after) for name, _, _, after in _prune_dependencies(
+            functions, tags_filter, single_function_mode))
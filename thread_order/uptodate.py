@@ -0,0 +1,158 @@
+"""
+Make-style up-to-date checks for thread_order.
+
+A task that declares the files it reads (inputs) and the files it writes
+(outputs) does not have to run again while its outputs are newer than its
+inputs. File metadata is gathered through a FileStats cache, so every path
+and glob is looked at once per run however many tasks share it.
+"""
+import os
+import glob
+import json
+import hashlib
+import threading
+from pathlib import Path
+from .cache import file_digest, _write_json
+
+class FileStats:
+    """ per-run cache of glob expansions, file stats and content digests
+
+        shared by the lookup thread and the workers; files are read outside the lock,
+        so two threads may look at the same file once each
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # pattern → sorted matching paths
+        self._globs = {}
+        # path → (modification time in ns, size), or None when it does not exist
+        self._stats = {}
+        # (path, stat) → sha256 hex digest of the content
+        self._digests = {}
+
+    def expand(self, patterns):
+        """ return the files matching patterns, or None when a pattern without
+            wildcards names a file that does not exist
+        """
+        paths = []
+        for pattern in patterns:
+            with self._lock:
+                matches = self._globs.get(pattern, False)
+            if matches is False:
+                if glob.has_magic(pattern):
+                    matches = glob.glob(pattern, recursive=True)
+                else:
+                    matches = [pattern] if self.stat(pattern) else None
+                if matches is not None:
+                    matches = sorted(path for path in matches if os.path.isfile(path))
+                with self._lock:
+                    self._globs[pattern] = matches
+            if matches is None:
+                return None
+            paths.extend(matches)
+        return sorted(set(paths))
+
+    def stat(self, path):
+        """ return (modification time in ns, size) of a file, or None when it does not exist
+        """
+        with self._lock:
+            if path in self._stats:
+                return self._stats[path]
+        try:
+            stat = os.stat(path)
+            value = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            value = None
+        with self._lock:
+            return self._stats.setdefault(path, value)
+
+    def digest(self, path):
+        """ return the sha256 hex digest of a file's content, or None when it cannot be read
+        """
+        key = (path, self.stat(path))
+        with self._lock:
+            if key in self._digests:
+                return self._digests[key]
+        try:
+            value = file_digest(path)
+        except OSError:
+            value = None
+        with self._lock:
+            return self._digests.setdefault(key, value)
+
+    def forget(self, paths):
+        """ drop what is known about paths, e.g. after a task wrote them; globs are
+            expanded again since they may match new files
+        """
+        with self._lock:
+            for path in paths:
+                self._stats.pop(path, None)
+            self._globs.clear()
+
+class BuildRecords:
+    """ digests of the inputs a task's outputs were last built from and the result it
+        returned, one entry per task, so inputs that were touched but not changed do not
+        force a rebuild and a task that does not run still has a result
+    """
+    def __init__(self, directory):
+        self._directory = Path(directory) / 'builds'
+
+    def _entry_path(self, key):
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self._directory / f'{name}.json'
+
+    def load(self, key):
+        """ return the entry recorded for key, {'inputs': {input path: digest}} plus the
+            task's 'result' when it could be stored, or None when there is none
+        """
+        try:
+            with open(self._entry_path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or not isinstance(entry.get('inputs'), dict):
+            return None
+        return entry
+
+    def save(self, key, inputs, result=None, has_result=False):
+        """ record {input path: digest} for key, and the result of the task when has_result
+            is set and it can be stored as JSON
+        """
+        entry = {'inputs': inputs}
+        if has_result:
+            try:
+                json.dumps(result)
+                entry['result'] = result
+            except (TypeError, ValueError):
+                pass
+        try:
+            _write_json(self._entry_path(key), entry)
+        except (OSError, TypeError, ValueError):
+            # best effort; without a record only modification times are compared
+            pass
+
+def input_digests(inputs, stats):
+    """ return {path: digest} of the files matching inputs, or None when one is missing
+    """
+    paths = stats.expand(inputs)
+    if paths is None:
+        return None
+    digests = {path: stats.digest(path) for path in paths}
+    return None if None in digests.values() else digests
+
+def is_up_to_date(inputs, outputs, stats, recorded=None):
+    """ return True if every output exists and is newer than every input, or the inputs
+        have the same content as recorded when the outputs were last built
+    """
+    output_stats = [stats.stat(path) for path in outputs]
+    if not output_stats or None in output_stats:
+        return False
+    paths = stats.expand(inputs)
+    if paths is None:
+        return False
+    input_stats = [stats.stat(path) for path in paths]
+    if None in input_stats:
+        return False
+    oldest_output = min(mtime for mtime, _ in output_stats)
+    if all(mtime <= oldest_output for mtime, _ in input_stats):
+        return True
+    return recorded is not None and input_digests(inputs, stats) == recorded